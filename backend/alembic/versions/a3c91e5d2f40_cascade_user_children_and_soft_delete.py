@@ -0,0 +1,43 @@
+"""cascade user children and soft delete
+
+Revision ID: a3c91e5d2f40
+Revises: 0f3b2a1c9d7e
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c91e5d2f40'
+down_revision: Union[str, None] = '0f3b2a1c9d7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHILD_TABLES = ("subdomains", "admin_tokens", "email_verifications")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("users", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+    
+    for table in CHILD_TABLES:
+        op.drop_constraint(f"{table}_user_id_fkey", table, type_="foreignkey")
+        op.create_foreign_key(
+            f"{table}_user_id_fkey", table, "users", ["user_id"], ["id"], ondelete="CASCADE"
+        )
+        # Postgres doesn't index FK columns on its own; cascades need it
+        op.create_index(f"ix_{table}_user_id", table, ["user_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in CHILD_TABLES:
+        op.drop_index(f"ix_{table}_user_id", table_name=table)
+        op.drop_constraint(f"{table}_user_id_fkey", table, type_="foreignkey")
+        op.create_foreign_key(f"{table}_user_id_fkey", table, "users", ["user_id"], ["id"])
+    
+    op.drop_column("users", "deleted_at")
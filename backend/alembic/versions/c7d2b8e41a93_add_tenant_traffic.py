@@ -0,0 +1,40 @@
+"""add tenant traffic
+
+Revision ID: c7d2b8e41a93
+Revises: a3c91e5d2f40
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2b8e41a93'
+down_revision: Union[str, None] = 'a3c91e5d2f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "tenant_traffic",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("subdomain_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("requests", sa.BigInteger(), nullable=False),
+        sa.Column("unique_visitors", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["subdomain_id"], ["subdomains.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("subdomain_id", "day", name="uq_tenant_traffic_subdomain_day"),
+    )
+    op.create_index(op.f("ix_tenant_traffic_id"), "tenant_traffic", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_tenant_traffic_id"), table_name="tenant_traffic")
+    op.drop_table("tenant_traffic")
@@ -0,0 +1,50 @@
+"""add custom domains
+
+Revision ID: e4b6f0c2d815
+Revises: c7d2b8e41a93
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b6f0c2d815'
+down_revision: Union[str, None] = 'c7d2b8e41a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "custom_domains",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("subdomain_id", sa.Integer(), nullable=False),
+        sa.Column("domain", sa.String(), nullable=False),
+        sa.Column("verification_token", sa.String(), nullable=False),
+        sa.Column("verified_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(["subdomain_id"], ["subdomains.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("subdomain_id", "domain", name="uq_custom_domains_subdomain_domain"),
+    )
+    op.create_index(op.f("ix_custom_domains_id"), "custom_domains", ["id"], unique=False)
+    op.create_index(op.f("ix_custom_domains_subdomain_id"), "custom_domains", ["subdomain_id"], unique=False)
+    op.create_index(op.f("ix_custom_domains_domain"), "custom_domains", ["domain"], unique=False)
+    op.create_index(
+        "uq_custom_domains_verified_domain", "custom_domains", ["domain"],
+        unique=True, postgresql_where=sa.text("verified_at IS NOT NULL")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("uq_custom_domains_verified_domain", table_name="custom_domains")
+    op.drop_index(op.f("ix_custom_domains_domain"), table_name="custom_domains")
+    op.drop_index(op.f("ix_custom_domains_subdomain_id"), table_name="custom_domains")
+    op.drop_index(op.f("ix_custom_domains_id"), table_name="custom_domains")
+    op.drop_table("custom_domains")
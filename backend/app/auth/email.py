@@ -1,10 +1,14 @@
+import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from ..config import settings
+from ..tracing import tracer
 import secrets
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 class EmailService:
     def __init__(self):
         self.smtp_server = settings.SMTP_SERVER
@@ -58,13 +62,14 @@ class EmailService:
         msg.attach(html_part)
 
         try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
+            with tracer.span("smtp.send", {"smtp.server": self.smtp_server}):
+                with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+                    server.starttls()
+                    server.login(self.smtp_username, self.smtp_password)
+                    server.send_message(msg)
             return True
-        except Exception as e:
-            print(f"Failed to send email: {e}")
+        except Exception:
+            logger.exception("Failed to send verification email", extra={"to_email": to_email})
             return False
 
 email_service = EmailService()
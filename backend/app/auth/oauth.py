@@ -1,6 +1,7 @@
 import httpx
 from authlib.integrations.httpx_client import AsyncOAuth2Client
 from ..config import settings
+from ..tracing import TracingTransport, traced
 
 class GitHubOAuth:
     def __init__(self):
@@ -24,8 +25,9 @@ class GitHubOAuth:
         query_string = "&".join([f"{k}={v}" for k, v in params.items()])
         return f"{self.authorize_url}?{query_string}"
 
+    @traced("oauth.github.get_access_token")
     async def get_access_token(self, code: str):
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(transport=TracingTransport()) as client:
             response = await client.post(
                 self.token_url,
                 data={
@@ -38,13 +40,14 @@ class GitHubOAuth:
             )
             return response.json()
 
+    @traced("oauth.github.get_user_info")
     async def get_user_info(self, access_token: str):
         headers = {
             "Authorization": f"token {access_token}",
             "Accept": "application/json"
         }
         
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(transport=TracingTransport()) as client:
             # Get user info
             user_response = await client.get(self.user_url, headers=headers)
             user_data = user_response.json()
@@ -89,8 +92,9 @@ class DiscordOAuth:
         query_string = "&".join([f"{k}={v}" for k, v in params.items()])
         return f"{self.authorize_url}?{query_string}"
 
+    @traced("oauth.discord.get_access_token")
     async def get_access_token(self, code: str):
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(transport=TracingTransport()) as client:
             response = await client.post(
                 self.token_url,
                 data={
@@ -104,10 +108,11 @@ class DiscordOAuth:
             )
             return response.json()
 
+    @traced("oauth.discord.get_user_info")
     async def get_user_info(self, access_token: str):
         headers = {"Authorization": f"Bearer {access_token}"}
         
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(transport=TracingTransport()) as client:
             response = await client.get(self.user_url, headers=headers)
             user_data = response.json()
             
@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+import secrets
+from typing import Awaitable, Callable, Optional
+
+from ..cache import redis_client
+from ..config import settings
+from ..singleflight import SingleFlight, RedisLock, wait_for
+
+STATE_KEY = "oauth:state:{}:{}"
+RESULT_KEY = "oauth:result:{}:{}"
+
+# Set when the login starts and required by the callback, so a callback URL
+# replayed from logs, Referer or another browser's history gets nothing
+BINDING_COOKIE = "oauth_binding"
+
+# Callbacks currently exchanging a code in this worker
+_flight = SingleFlight()
+
+class OAuthStateError(Exception):
+    pass
+
+async def issue_state(provider: str) -> str:
+    state = secrets.token_urlsafe(32)
+    await redis_client.set(STATE_KEY.format(provider, state), "1", ex=settings.OAUTH_STATE_TTL_SECONDS)
+    return state
+
+def state_binding(provider: str, state: str) -> str:
+    # Signed with the app secret: knowing the state (it's in the callback URL)
+    # isn't enough to forge the cookie
+    message = f"{provider}:{state}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+def binding_matches(provider: str, state: Optional[str], binding: Optional[str]) -> bool:
+    if not state or not binding:
+        return False
+    return hmac.compare_digest(state_binding(provider, state), binding)
+
+async def consume_state(provider: str, state: Optional[str]) -> bool:
+    # GETDEL makes each state single-use even across workers
+    if not state:
+        return False
+    return await redis_client.getdel(STATE_KEY.format(provider, state)) is not None
+
+async def run_callback_once(
+    provider: str,
+    code: str,
+    state: Optional[str],
+    binding: Optional[str],
+    exchange: Callable[[], Awaitable[str]]
+) -> str:
+    # Only the browser that started the login may finish it, or share in
+    # its result
+    if not binding_matches(provider, state, binding):
+        raise OAuthStateError("OAuth login was started in a different browser or has expired")
+    
+    # Double-clicked or retried callbacks carry the same code; they share the
+    # first exchange's result instead of hitting the provider again
+    code_hash = hashlib.sha256(f"{code}:{state}".encode()).hexdigest()
+    result_key = RESULT_KEY.format(provider, code_hash)
+    
+    async def get_result() -> Optional[str]:
+        result = await redis_client.get(result_key)
+        return result.decode() if result is not None else None
+    
+    async def run() -> str:
+        cached = await get_result()
+        if cached is not None:
+            return cached
+        
+        lock = RedisLock(redis_client, result_key, settings.OAUTH_CALLBACK_WAIT_SECONDS * 1000)
+        if not await lock.acquire():
+            # Another worker holds the exchange; wait for the result it stores
+            result = await wait_for(get_result, settings.OAUTH_CALLBACK_WAIT_SECONDS, interval=0.1)
+            if result is None:
+                raise OAuthStateError("OAuth login is already in progress")
+            return result
+        
+        try:
+            if not await consume_state(provider, state):
+                raise OAuthStateError("Invalid or expired OAuth state")
+            
+            result = await exchange()
+            await redis_client.set(result_key, result, ex=settings.OAUTH_RESULT_TTL_SECONDS)
+            return result
+        finally:
+            await lock.release()
+    
+    return await _flight.do((provider, code_hash), run)
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import math
+import random
+import time
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from typing import Awaitable, Callable, Optional
+
+from .config import settings
+from .singleflight import SingleFlight, RedisLock, wait_for
+
+logger = logging.getLogger(__name__)
+
+redis_client = redis.from_url(settings.REDIS_URL)
+
+# Cache keys for pre-encoded public responses
+SUBDOMAIN_KEY = "cache:subdomain:{}"
+PROFILE_KEY = "cache:profile:{}"
+
+_flight = SingleFlight()
+
+# Delayed deletes still pending; holding them keeps the tasks alive
+_pending_deletes = set()
+
+# wait_for probe result: the other worker released its lock without a value
+_RELEASED = object()
+
+def reset_redis_after_fork():
+    # Drop any connections inherited from the parent process
+    redis_client.connection_pool.reset()
+
+async def _get_entry(key: str):
+    # Entries are hashes of the value and how long it took to compute (ms);
+    # the remaining TTL gives the expiry for early refresh. A negative entry
+    # ("n" set) records that the loader found nothing, and has value None.
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hmget(key, "v", "d", "n")
+            pipe.pttl(key)
+            (value, delta, negative), ttl_ms = await pipe.execute()
+    except RedisError:
+        # A cache outage should only cost us the fast path
+        return None
+    if value is None:
+        return None
+    return (None if negative else value), int(delta or 0), ttl_ms
+
+async def _set_entry(key: str, value: Optional[bytes], delta_ms: int, ttl: int):
+    mapping = {"v": value, "d": delta_ms} if value is not None else {"v": b"", "d": delta_ms, "n": 1}
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, ttl)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+def _should_refresh_early(delta_ms: int, ttl_ms: int) -> bool:
+    # XFetch: the closer to expiry and the slower the load, the likelier a
+    # single request refreshes ahead of time, so hot keys never expire at once
+    if ttl_ms <= 0:
+        return False
+    jitter = -delta_ms * settings.CACHE_EARLY_REFRESH_BETA * math.log(1 - random.random())
+    return jitter >= ttl_ms
+
+async def get_or_load(
+    key: str,
+    loader: Callable[[], Awaitable[Optional[bytes]]],
+    ttl: int = settings.CACHE_TTL_SECONDS
+) -> Optional[bytes]:
+    entry = await _get_entry(key)
+    if entry is not None:
+        value, delta_ms, ttl_ms = entry
+        if not _should_refresh_early(delta_ms, ttl_ms):
+            return value
+    
+    async def load() -> Optional[bytes]:
+        lock = RedisLock(redis_client, key, settings.CACHE_LOCK_TIMEOUT_MS)
+        if not await lock.acquire():
+            # Another worker is loading: serve what we have, or wait for it
+            if entry is not None:
+                return entry[0]
+            waited = await wait_for(_entry_or_release(key, lock), settings.CACHE_LOCK_TIMEOUT_MS / 1000)
+            if waited is not None and waited is not _RELEASED:
+                return waited[0]
+            # Released without an entry (e.g. Redis write failed) or timed
+            # out: load for ourselves rather than wait any longer
+        try:
+            started = time.monotonic()
+            value = await loader()
+            delta_ms = int((time.monotonic() - started) * 1000)
+            # Misses are cached briefly too, so lookups of names that don't
+            # exist neither hit the database nor wait on each other's locks
+            await _set_entry(key, value, delta_ms, ttl if value is not None else settings.CACHE_NEGATIVE_TTL_SECONDS)
+            return value
+        finally:
+            await lock.release()
+    
+    return await _flight.do(key, load)
+
+def _entry_or_release(key: str, lock: RedisLock):
+    async def probe():
+        entry = await _get_entry(key)
+        if entry is not None:
+            return entry
+        if not await lock.locked():
+            return _RELEASED
+        return None
+    return probe
+
+async def _delete(keys):
+    try:
+        await redis_client.delete(*keys)
+    except RedisError:
+        logger.warning("Could not invalidate %s", ", ".join(keys), exc_info=True)
+
+def _delete_later(keys):
+    task = asyncio.ensure_future(_delete(keys))
+    _pending_deletes.add(task)
+    task.add_done_callback(_delete_done)
+
+def _delete_done(task: asyncio.Task):
+    _pending_deletes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Delayed cache invalidation failed", exc_info=task.exception())
+
+async def invalidate(*keys: str):
+    if not keys:
+        return
+    await _delete(keys)
+    
+    if settings.READ_REPLICA_URLS:
+        # A lagging replica can refill the cache with the old row, so delete
+        # again once the read-your-writes window has passed
+        loop = asyncio.get_running_loop()
+        loop.call_later(settings.READ_YOUR_WRITES_SECONDS, _delete_later, keys)
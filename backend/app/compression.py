@@ -0,0 +1,127 @@
+import gzip
+from collections import OrderedDict
+from typing import Optional, Tuple
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+from .config import settings
+from .singleflight import SingleFlight
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Per-request bodies are compressed at a moderate level; bodies with an ETag
+# are compressed once at a high level and the result kept in memory
+GZIP_LEVEL = 6
+GZIP_CACHED_LEVEL = 9
+BROTLI_QUALITY = 4
+BROTLI_CACHED_QUALITY = 11
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+# (etag, encoding) -> compressed body, most recently used last
+_variants: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+_flight = SingleFlight()
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    # Prefer brotli, then gzip; a q=0 entry rules an encoding out
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(coding.strip())
+
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_CACHED_QUALITY if cached else BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(body, compresslevel=GZIP_CACHED_LEVEL if cached else GZIP_LEVEL, mtime=0)
+
+async def _compress(body: bytes, encoding: str, cached: bool) -> bytes:
+    # Large bodies are compressed in the threadpool so the event loop keeps
+    # serving; for small ones the thread hop costs more than it saves
+    if cached or len(body) >= settings.COMPRESSION_OFFLOAD_SIZE:
+        return await run_in_threadpool(compress, body, encoding, cached)
+    return compress(body, encoding)
+
+async def _cached_variant(etag: str, body: bytes, encoding: str) -> bytes:
+    key = (etag, encoding)
+    data = _variants.get(key)
+    if data is not None:
+        _variants.move_to_end(key)
+        return data
+
+    async def load():
+        data = await _compress(body, encoding, cached=True)
+        _variants[key] = data
+        if len(_variants) > settings.COMPRESSION_CACHE_SIZE:
+            _variants.popitem(last=False)
+        return data
+
+    # A hot response that just changed is compressed once, not per request
+    return await _flight.do(key, load)
+
+def _compressible(response: Response) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if "content-encoding" in response.headers:
+        return False
+    # Streams of unknown length are passed through untouched
+    length = response.headers.get("content-length")
+    if length is None:
+        return False
+    # Compressing per request only pays for larger bodies; a cached variant is
+    # compressed once, so the small tenant and profile bodies qualify too
+    if "etag" in response.headers:
+        min_size = settings.COMPRESSION_CACHED_MIN_SIZE
+    else:
+        min_size = settings.COMPRESSION_MIN_SIZE
+    if int(length) < min_size:
+        return False
+    return response.headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+async def compress_response(request: Request, call_next) -> Response:
+    response = await call_next(request)
+    if not _compressible(response):
+        return response
+
+    # Shared caches must keep compressed and plain variants apart
+    response.headers.append("Vary", "Accept-Encoding")
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+    if encoding is None:
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = response.headers.get("etag")
+    if etag:
+        data = await _cached_variant(etag, body, encoding)
+    else:
+        data = await _compress(body, encoding, cached=False)
+
+    if len(data) >= len(body):
+        # Near the threshold the encoding can outweigh the savings
+        plain = Response(content=body, status_code=response.status_code)
+        plain.raw_headers = response.raw_headers
+        return plain
+
+    compressed = Response(content=data, status_code=response.status_code)
+    compressed.raw_headers = [
+        (k, v) for k, v in response.raw_headers if k.lower() not in (b"content-length", b"etag")
+    ] + compressed.raw_headers
+    compressed.headers["Content-Encoding"] = encoding
+    if etag:
+        # Same resource, different bytes: a weak validator still matches
+        # If-None-Match, which compares weakly
+        compressed.headers["ETag"] = etag if etag.startswith("W/") else "W/" + etag
+    return compressed
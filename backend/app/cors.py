@@ -0,0 +1,57 @@
+from starlette.datastructures import Headers
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+
+from .host_resolver import PLATFORM_LABELS, host_resolver
+from .prefilter import name_prefilter
+
+PREFLIGHT_CACHE_SIZE = 4096
+
+class TenantCORSMiddleware(CORSMiddleware):
+    # Allows the configured origins plus platform subdomains and custom domains
+    # that belong to a tenant, and answers repeat preflights from a per-origin
+    # cache
+
+    def __init__(self, app, **kwargs):
+        super().__init__(app, **kwargs)
+        self.preflight_cache = {}
+        self.resolver_version = host_resolver.version
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        if origin in self.allow_origins:
+            return True
+        if not origin.startswith("https://"):
+            return False
+        host = origin[len("https://"):]
+        if host in host_resolver.hosts:
+            return True
+        label = host_resolver.platform_label(host)
+        if label is None:
+            return False
+        # The prefilter is a superset of real tenants; a rare false positive
+        # only admits an origin nobody serves content from
+        return label in PLATFORM_LABELS or name_prefilter.might_exist("subdomain", label)
+
+    def preflight_response(self, request_headers: Headers) -> Response:
+        key = (
+            request_headers.get("origin"),
+            request_headers.get("access-control-request-method"),
+            request_headers.get("access-control-request-headers"),
+        )
+        # A removed custom domain must stop passing preflight
+        if self.resolver_version != host_resolver.version:
+            self.preflight_cache.clear()
+            self.resolver_version = host_resolver.version
+        
+        response = self.preflight_cache.get(key)
+        if response is not None:
+            return response
+        
+        response = super().preflight_response(request_headers)
+        # Only successes are cached, so a newly created tenant isn't stuck
+        # with an earlier rejection
+        if response.status_code == 200:
+            if len(self.preflight_cache) >= PREFLIGHT_CACHE_SIZE:
+                self.preflight_cache.clear()
+            self.preflight_cache[key] = response
+        return response
@@ -1,15 +1,145 @@
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from redis.exceptions import RedisError
+from typing import Optional
+import itertools
+import logging
+import time
+from .auth.jwt import verify_token
+from .cache import redis_client
 from .config import settings
+from .tracing import instrument_engine
 
-engine = create_engine(settings.DATABASE_URL)
+logger = logging.getLogger(__name__)
+
+def engine_options(
+    url: str,
+    pooler: str = settings.DATABASE_POOLER,
+    local_pool_size: int = settings.DATABASE_LOCAL_POOL_SIZE
+) -> dict:
+    if pooler != "pgbouncer":
+        return {}
+    
+    # Behind PgBouncer in transaction mode each transaction may land on a
+    # different server connection, so keep the local pool small (or off)
+    # and never rely on per-connection server state
+    if local_pool_size <= 0:
+        options = {"poolclass": NullPool}
+    else:
+        options = {"pool_size": local_pool_size, "max_overflow": 0}
+    
+    if url.startswith("postgresql+psycopg:"):
+        # psycopg 3 switches to server-side prepares after a few executions
+        options["connect_args"] = {"prepare_threshold": None}
+    # psycopg2 only uses client-side parameter binding, so it needs nothing
+    return options
+
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Set per user after a write so their reads go to the primary for a while
+RECENT_WRITE_KEY = "recent_write:{}"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+def replica_engine_options(url: str) -> dict:
+    options = engine_options(url)
+    options["connect_args"] = {
+        **options.get("connect_args", {}),
+        "connect_timeout": settings.REPLICA_CONNECT_TIMEOUT_SECONDS,
+    }
+    return options
+
+class ReplicaRouter:
+    def __init__(self, urls):
+        self.engines = [create_engine(url, pool_pre_ping=True, **replica_engine_options(url)) for url in urls]
+        for replica in self.engines:
+            instrument_engine(replica)
+        self.sessionmakers = [
+            sessionmaker(autocommit=False, autoflush=False, bind=replica)
+            for replica in self.engines
+        ]
+        self.down_until = [0.0] * len(self.sessionmakers)
+        self._counter = itertools.count()
+
+    def session(self):
+        # Round-robin over healthy replicas; None means "use the primary"
+        for _ in range(len(self.sessionmakers)):
+            index = next(self._counter) % len(self.sessionmakers)
+            if self.down_until[index] > time.monotonic():
+                continue
+            
+            db = self.sessionmakers[index]()
+            try:
+                # Check out a connection now so a dead replica fails over here
+                db.connection()
+                return db
+            except DBAPIError:
+                db.close()
+                self.down_until[index] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        return None
+
+replica_router = ReplicaRouter(settings.READ_REPLICA_URLS)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def open_read_session():
+    return replica_router.session() or SessionLocal()
+
+def bearer_subject(request: Request) -> Optional[str]:
+    # The client authenticates with a bearer token on every call, so the
+    # token's subject (the username) identifies who just wrote
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return verify_token(token)
+
+async def mark_recent_write(request: Request):
+    subject = bearer_subject(request)
+    if subject is None:
+        return
+    try:
+        await redis_client.set(RECENT_WRITE_KEY.format(subject), "1", ex=settings.READ_YOUR_WRITES_SECONDS)
+    except RedisError:
+        logger.warning("Could not pin %s to the primary", subject, exc_info=True)
+
+async def wrote_recently(request: Request) -> bool:
+    subject = bearer_subject(request)
+    if subject is None:
+        return False
+    try:
+        return bool(await redis_client.exists(RECENT_WRITE_KEY.format(subject)))
+    except RedisError:
+        # Can't tell, so take the safe side
+        return True
+
+async def get_read_db(request: Request):
+    # Read-only endpoints go to a replica unless this user just wrote
+    if settings.READ_REPLICA_URLS and not await wrote_recently(request):
+        # Checking out a replica connection blocks, for up to the connect
+        # timeout when a replica is down, so keep it off the event loop
+        db = await run_in_threadpool(open_read_session)
+    else:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def dispose_engines_after_fork():
+    # Forked workers must not reuse the parent's pooled connections;
+    # close=False leaves them open for the parent and just forgets them here
+    engine.dispose(close=False)
+    for replica in replica_router.engines:
+        replica.dispose(close=False)
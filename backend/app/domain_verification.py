@@ -0,0 +1,40 @@
+import logging
+import secrets
+import dns.asyncresolver
+import dns.exception
+
+logger = logging.getLogger(__name__)
+
+# Ownership of a custom domain is proven with a DNS TXT record:
+#
+#     _luminara-challenge.www.example.com.  TXT  "luminara-verification=<token>"
+#
+# DNS rather than an HTTP challenge, because a domain pointed at the platform
+# would answer an HTTP challenge with our own content whoever owns it.
+
+CHALLENGE_LABEL = "_luminara-challenge"
+CHALLENGE_PREFIX = "luminara-verification="
+
+def new_token() -> str:
+    return secrets.token_urlsafe(24)
+
+def challenge_name(domain: str) -> str:
+    return f"{CHALLENGE_LABEL}.{domain}"
+
+def challenge_value(token: str) -> str:
+    return f"{CHALLENGE_PREFIX}{token}"
+
+async def has_challenge(domain: str, token: str) -> bool:
+    try:
+        answer = await dns.asyncresolver.resolve(challenge_name(domain), "TXT", lifetime=5)
+    except dns.exception.DNSException as e:
+        # NXDOMAIN, no TXT records or a timeout: not verified (yet)
+        logger.info("Challenge lookup for %s failed: %s", domain, e.__class__.__name__)
+        return False
+    
+    expected = challenge_value(token)
+    for record in answer:
+        # Long TXT values arrive split into 255-byte strings
+        if b"".join(record.strings).decode(errors="replace") == expected:
+            return True
+    return False
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional
+from fastapi.concurrency import run_in_threadpool
+from redis.exceptions import RedisError
+
+from .cache import redis_client
+from .config import settings
+from .database import SessionLocal
+from .models.user import User, Subdomain, CustomDomain
+
+logger = logging.getLogger(__name__)
+
+# Other workers publish custom-domain changes on this channel as
+# "<host> <subdomain>", or just "<host>" when the domain was removed
+HOSTS_CHANNEL = "hosts:update"
+
+# Platform hosts that are not tenants
+PLATFORM_LABELS = frozenset({"api", "www", "admin"})
+
+# How long startup waits for the listener before building the table anyway
+SUBSCRIBE_TIMEOUT_SECONDS = 5
+
+def normalize_host(host: str) -> str:
+    # Drop the port and any trailing dot; hosts are case-insensitive
+    return host.partition(":")[0].rstrip(".").lower()
+
+# Per-worker host -> tenant table. Custom domains live in an exact-match dict;
+# platform subdomains are recognised by their suffix, so resolving a request
+# costs one dict lookup and one string comparison however many domains exist.
+class HostResolver:
+    def __init__(self):
+        self.hosts: Dict[str, str] = {}
+        self.suffix = "." + settings.ROOT_DOMAIN
+        # Bumped on every change so callers can drop anything derived from it
+        self.version = 0
+        self.ready = False
+        # Collects updates while a rebuild scan is running
+        self._replay = None
+        self._rebuild_lock = asyncio.Lock()
+        # Set once the listener is subscribed and will replay what it hears
+        self.subscribed = asyncio.Event()
+
+    def platform_label(self, host: str) -> Optional[str]:
+        # "<label>.ROOT_DOMAIN" -> label, for exactly one label
+        if not host.endswith(self.suffix):
+            return None
+        label = host[:-len(self.suffix)]
+        if not label or "." in label:
+            return None
+        return label
+
+    def resolve(self, host: str) -> Optional[str]:
+        host = normalize_host(host)
+        tenant = self.hosts.get(host)
+        if tenant is not None:
+            return tenant
+        label = self.platform_label(host)
+        if label is None or label in PLATFORM_LABELS:
+            return None
+        return label
+
+    def _apply(self, host: str, subdomain: Optional[str]):
+        if self._replay is not None:
+            self._replay.append((host, subdomain))
+        if subdomain is None:
+            self.hosts.pop(host, None)
+        else:
+            self.hosts[host] = subdomain
+        self.version += 1
+
+    async def _publish(self, message: str):
+        try:
+            await redis_client.publish(HOSTS_CHANNEL, message)
+        except RedisError:
+            # Peers catch up at their next resync
+            pass
+
+    async def set(self, hosts: Iterable[str], subdomain: str):
+        for host in hosts:
+            self._apply(host, subdomain)
+            await self._publish(f"{host} {subdomain}")
+
+    async def remove(self, hosts: Iterable[str]):
+        for host in hosts:
+            self._apply(host, None)
+            await self._publish(host)
+
+    def _scan(self) -> Dict[str, str]:
+        # Only verified domains are ever served
+        db = SessionLocal()
+        try:
+            rows = db.query(CustomDomain.domain, Subdomain.subdomain).join(
+                Subdomain, CustomDomain.subdomain_id == Subdomain.id
+            ).join(User).filter(
+                CustomDomain.verified_at.isnot(None),
+                User.deleted_at.is_(None)
+            ).yield_per(5000)
+            return {domain: name for domain, name in rows}
+        finally:
+            db.close()
+
+    async def rebuild(self):
+        # The database is the source of truth; changes that arrive while the
+        # scan runs are replayed on top so they aren't lost. The swap happens
+        # on the event loop, so no update can slip in between.
+        async with self._rebuild_lock:
+            self._replay = []
+            try:
+                hosts = await run_in_threadpool(self._scan)
+                for host, subdomain in self._replay:
+                    if subdomain is None:
+                        hosts.pop(host, None)
+                    else:
+                        hosts[host] = subdomain
+            finally:
+                self._replay = None
+            self.hosts = hosts
+            self.version += 1
+            self.ready = True
+
+    async def wait_until_subscribed(self, timeout: float = SUBSCRIBE_TIMEOUT_SECONDS):
+        try:
+            await asyncio.wait_for(self.subscribed.wait(), timeout)
+        except asyncio.TimeoutError:
+            # Redis is down; build without it and let the listener rebuild
+            # once it gets through
+            logger.warning("Host resolver listener not subscribed after %ss", timeout)
+
+    async def listen(self):
+        while True:
+            try:
+                pubsub = redis_client.pubsub()
+                await pubsub.subscribe(HOSTS_CHANNEL)
+                self.subscribed.set()
+                if self.ready:
+                    # The table was built without us listening (a reconnect,
+                    # or Redis was down at startup); updates published
+                    # meanwhile are gone
+                    await self._rebuild_logged()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    host, _, subdomain = message["data"].decode().partition(" ")
+                    self._apply(host, subdomain or None)
+            except RedisError:
+                await asyncio.sleep(5)
+
+    async def resync(self):
+        # Backstop for anything pub/sub dropped without a disconnect
+        while True:
+            await asyncio.sleep(settings.HOST_RESOLVER_RESYNC_SECONDS)
+            await self._rebuild_logged()
+
+    async def _rebuild_logged(self):
+        try:
+            await self.rebuild()
+        except Exception:
+            # Keep serving the current table; the next resync tries again
+            logger.exception("Host resolver rebuild failed")
+
+host_resolver = HostResolver()
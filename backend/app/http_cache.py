@@ -0,0 +1,40 @@
+import hashlib
+from fastapi import Request
+from fastapi.responses import Response
+
+from .config import settings
+from .serializers import json_response
+
+# Built once; the policy only changes with a restart
+CACHE_CONTROL = (
+    f"public, max-age={settings.PUBLIC_CACHE_MAX_AGE}, "
+    f"s-maxage={settings.PUBLIC_CACHE_SHARED_MAX_AGE}, "
+    f"stale-while-revalidate={settings.PUBLIC_CACHE_STALE_WHILE_REVALIDATE}"
+)
+
+def compute_etag(body: bytes) -> str:
+    # Strong validator derived from the exact bytes we send
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so ignore any W/ prefix
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def conditional_response(request: Request, body: bytes) -> Response:
+    etag = compute_etag(body)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return json_response(body, headers=headers)
@@ -0,0 +1,179 @@
+import hashlib
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from redis.exceptions import RedisError
+from typing import Optional
+import orjson
+
+from .cache import redis_client
+from .config import settings
+from .singleflight import RedisLock, wait_for
+from .traffic import visitor_id
+
+# Endpoints that clients retry on timeouts and that must not run twice,
+# mapped to whether their response may be stored for replay. Responses that
+# carry credentials are never written to Redis; a retry gets a 409 instead.
+IDEMPOTENT_ROUTES = {
+    ("POST", "/auth/signup"): True,
+    ("POST", "/subdomains/"): True,
+    ("POST", "/subdomains/my/admin-token"): False,
+}
+
+RESULT_KEY = "idempotency:{}"
+
+# wait_for probe result: the first attempt released its lock without a result
+_RELEASED = object()
+
+NOT_STORED_BODY = orjson.dumps({
+    "detail": "A request with this Idempotency-Key already succeeded; its response contained credentials and can't be replayed"
+})
+
+def _scope(request: Request, key: str) -> str:
+    # Keys are only unique per client, so scope them by route and credentials;
+    # anonymous callers are told apart by address and user agent
+    client = request.headers.get("authorization") or f"anon:{visitor_id(request)}"
+    raw = f"{request.method} {request.url.path} {client} {key}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def _buffer_body(request: Request) -> bytes:
+    # Read the body here and hand the same bytes to the route. Starlette 0.27's
+    # call_next reads from request.receive, which is already drained by now.
+    body = await request.body()
+    
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    
+    request._receive = receive
+    return body
+
+async def _load(result_key: str) -> Optional[dict]:
+    stored = await redis_client.hgetall(result_key)
+    if not stored:
+        return None
+    return {
+        "status": int(stored[b"status"]),
+        "headers": orjson.loads(stored[b"headers"]),
+        "body": stored[b"body"],
+        "fingerprint": stored.get(b"fingerprint", b"").decode(),
+    }
+
+async def _store(result_key: str, result: dict):
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(result_key, mapping={
+                "status": result["status"],
+                "headers": orjson.dumps(result["headers"]),
+                "body": result["body"],
+                "fingerprint": result["fingerprint"],
+            })
+            pipe.expire(result_key, settings.IDEMPOTENCY_TTL_SECONDS)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+def _result_or_release(result_key: str, lock: RedisLock):
+    async def probe():
+        stored = await _load(result_key)
+        if stored is not None:
+            return stored
+        if not await lock.locked():
+            return _RELEASED
+        return None
+    return probe
+
+def _replay(result: dict, fingerprint: str) -> Response:
+    if result["fingerprint"] != fingerprint:
+        return JSONResponse(
+            status_code=422,
+            content={"detail": "This Idempotency-Key was already used with a different request body"}
+        )
+    response = Response(content=result["body"], status_code=result["status"])
+    response.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in result["headers"]]
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+async def idempotent_call(request: Request, call_next) -> Response:
+    key = request.headers.get("idempotency-key")
+    route = (request.method, request.url.path)
+    if not key or route not in IDEMPOTENT_ROUTES:
+        return await call_next(request)
+    
+    if len(key) > 255:
+        return JSONResponse(status_code=400, content={"detail": "Idempotency-Key is too long"})
+    
+    result_key = RESULT_KEY.format(_scope(request, key))
+    fingerprint = hashlib.sha256(await _buffer_body(request)).hexdigest()
+    
+    try:
+        stored = await _load(result_key)
+    except RedisError:
+        # Without Redis we can't deduplicate; fall back to a plain call
+        return await call_next(request)
+    if stored is not None:
+        return _replay(stored, fingerprint)
+    
+    # The lock covers duplicates from this worker and from every other one
+    lock = RedisLock(redis_client, result_key, settings.IDEMPOTENCY_LOCK_MS)
+    waited = False
+    while not await lock.acquire():
+        waited = True
+        try:
+            stored = await wait_for(
+                _result_or_release(result_key, lock), settings.IDEMPOTENCY_LOCK_MS / 1000, interval=0.1
+            )
+        except RedisError:
+            stored = None
+        if stored is _RELEASED:
+            # The first attempt failed without storing anything (it raised, or
+            # hit a server error), so this retry gets to run it for real
+            continue
+        if stored is None:
+            return JSONResponse(
+                status_code=409,
+                content={"detail": "A request with this Idempotency-Key is still in progress"}
+            )
+        return _replay(stored, fingerprint)
+    
+    try:
+        if waited:
+            # A result stored just before the lock was released only shows up now
+            try:
+                stored = await _load(result_key)
+            except RedisError:
+                stored = None
+            if stored is not None:
+                return _replay(stored, fingerprint)
+        
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        if IDEMPOTENT_ROUTES[route] or response.status_code >= 400:
+            result = {
+                "status": response.status_code,
+                "headers": [
+                    (k.decode("latin-1"), v.decode("latin-1")) for k, v in response.raw_headers
+                    if k.lower() != b"set-cookie"
+                ],
+                "body": body,
+                "fingerprint": fingerprint,
+            }
+        else:
+            # Pin the key without keeping the credentials
+            result = {
+                "status": 409,
+                "headers": [
+                    ("content-length", str(len(NOT_STORED_BODY))),
+                    ("content-type", "application/json"),
+                ],
+                "body": NOT_STORED_BODY,
+                "fingerprint": fingerprint,
+            }
+        # Server errors are worth retrying for real, so don't pin them
+        if response.status_code < 500:
+            await _store(result_key, result)
+    finally:
+        await lock.release()
+    
+    # The body iterator is spent, so hand back a buffered copy
+    buffered = Response(content=body, status_code=response.status_code)
+    buffered.raw_headers = response.raw_headers
+    return buffered
@@ -0,0 +1,104 @@
+import time
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from .config import settings
+
+# Expensive auth work (bcrypt, SMTP, OAuth provider round-trips) is shed
+# first, cheap reads last, and health probes never. Everything else is
+# classed by method; these routes don't fit that, e.g. GET callbacks that
+# call the provider and write users.
+ROUTE_CLASSES = {
+    ("POST", "/auth/signup"): "auth",
+    ("POST", "/auth/login"): "auth",
+    ("POST", "/auth/resend-verification"): "auth",
+    ("GET", "/auth/github/callback"): "auth",
+    ("GET", "/auth/discord/callback"): "auth",
+    ("GET", "/auth/verify-email"): "write",
+}
+
+class AdaptiveLimiter:
+    # AIMD: grow the limit by ~1 per window of fast responses, cut it by a
+    # fixed factor when a response is slower than the class target. Only
+    # requests that started after the last cut can cut again, so one burst
+    # costs one decrease per round trip rather than one per slow response.
+
+    def __init__(self, name: str, target_ms: float, initial: int, min_limit: int, max_limit: int, shed_at: float):
+        self.name = name
+        self.target_ms = target_ms
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        # Fraction of the worker-wide in-flight cap at which this class sheds
+        self.shed_at = shed_at
+        self.in_flight = 0
+        self.decreased_at = 0.0
+
+    def release(self, started: float, latency_ms: float):
+        self.in_flight -= 1
+        if latency_ms > self.target_ms:
+            if started >= self.decreased_at:
+                self.limit = max(self.min_limit, self.limit * settings.LOAD_SHED_BACKOFF)
+                self.decreased_at = time.perf_counter()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+class LoadShedder:
+    def __init__(self):
+        self.limiters = {
+            "read": AdaptiveLimiter("read", target_ms=100, initial=64, min_limit=8, max_limit=512, shed_at=1.0),
+            "write": AdaptiveLimiter("write", target_ms=500, initial=32, min_limit=4, max_limit=256, shed_at=0.9),
+            "auth": AdaptiveLimiter("auth", target_ms=1000, initial=8, min_limit=1, max_limit=64, shed_at=0.75),
+        }
+        self.in_flight = 0
+
+    def classify(self, request: Request):
+        path = request.url.path
+        if path == "/health":
+            return None
+        name = ROUTE_CLASSES.get((request.method, path))
+        if name is not None:
+            return self.limiters[name]
+        if request.method in ("GET", "HEAD", "OPTIONS"):
+            return self.limiters["read"]
+        if path.startswith("/subdomains/my/domains/") and path.endswith("/verify"):
+            # DNS lookup against the tenant's nameservers
+            return self.limiters["auth"]
+        return self.limiters["write"]
+
+    def try_acquire(self, limiter: AdaptiveLimiter) -> bool:
+        # The event loop is single-threaded, so plain counters are safe here
+        if limiter.in_flight >= int(limiter.limit):
+            return False
+        if self.in_flight >= settings.LOAD_SHED_MAX_IN_FLIGHT * limiter.shed_at:
+            return False
+        limiter.in_flight += 1
+        self.in_flight += 1
+        return True
+
+    def release(self, limiter: AdaptiveLimiter, started: float):
+        self.in_flight -= 1
+        limiter.release(started, (time.perf_counter() - started) * 1000)
+
+load_shedder = LoadShedder()
+
+def overloaded_response(limiter: AdaptiveLimiter) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly", "type": "overloaded"},
+        headers={"Retry-After": str(settings.LOAD_SHED_RETRY_AFTER_SECONDS), "X-Shed-Class": limiter.name}
+    )
+
+async def shed_or_call(request: Request, call_next):
+    limiter = load_shedder.classify(request)
+    if limiter is None or not settings.LOAD_SHED_ENABLED:
+        return await call_next(request)
+    
+    if not load_shedder.try_acquire(limiter):
+        return overloaded_response(limiter)
+    
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        load_shedder.release(limiter, started)
@@ -0,0 +1,79 @@
+import atexit
+import copy
+import logging
+import queue
+import random
+import sys
+import traceback
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+
+from .config import settings
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default=None)
+
+access_logger = logging.getLogger("luminara.access")
+
+# Attributes every LogRecord has; anything else was passed via extra=
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+class ContextQueueHandler(QueueHandler):
+    # Runs on the calling thread: capture the request id and render the
+    # message and traceback here, so the listener only has to serialize
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+class AccessSampler(logging.Filter):
+    # Keep a sample of ordinary requests, but every slow or failed one
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "status", 0) >= 500:
+            return True
+        if getattr(record, "duration_ms", 0) >= settings.SLOW_REQUEST_MS:
+            return True
+        return random.random() < settings.ACCESS_LOG_SAMPLE_RATE
+
+def setup_logging():
+    # Safe to call again in a forked worker: the listener thread doesn't
+    # survive fork, so each process gets a fresh queue and listener
+    log_queue = queue.SimpleQueue()
+    
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    
+    # Writes happen on the listener's thread, never on the event loop
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    root = logging.getLogger()
+    root.handlers = [ContextQueueHandler(log_queue)]
+    root.setLevel(settings.LOG_LEVEL)
+    
+    access_logger.filters = [AccessSampler()]
+    return listener
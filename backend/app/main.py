@@ -1,78 +1,199 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse
 from sqlalchemy.orm import Session
-import re
+from functools import lru_cache
+import asyncio
+import logging
+import time
+import uuid
+from typing import Optional
 
-from .database import get_db, engine, Base
-from .routes import auth, users, subdomains
+from .database import get_db, SAFE_METHODS, mark_recent_write
+from .routes import auth, users, subdomains, profiles
 from .config import settings
+from .compression import compress_response
+from .cors import TenantCORSMiddleware
+from .host_resolver import host_resolver
+from .http_cache import conditional_response
+from .idempotency import idempotent_call
+from .load_shedding import shed_or_call
+from .logging_config import setup_logging, request_id_var, access_logger
+from .prefilter import name_prefilter
+from .profiler import RequestProfiler, save_profile, should_profile
+from .purge import purge_deleted_users
+from .serializers import encode
+from .tracing import tracer
+from .traffic import traffic_counter
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Luminara Systems API",
     description="Multi-tenant subdomain platform",
-    version="1.0.0"
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "https://myluminarasystem.pro",
-        "https://*.myluminarasystem.pro",
-        "http://localhost:3000",  # For development
-        "http://localhost:5173",  # Vite dev server
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Subdomain detection middleware
 @app.middleware("http")
 async def subdomain_middleware(request: Request, call_next):
-    host = request.headers.get("host", "")
+    # Custom domains and <name>.ROOT_DOMAIN both map to the tenant's subdomain
+    subdomain = host_resolver.resolve(request.headers.get("host", ""))
+    request.state.subdomain = subdomain
+    if subdomain is not None:
+        traffic_counter.record(subdomain, request)
+    
+    response = await call_next(request)
+    return response
+
+@app.on_event("startup")
+async def purge_leftover_accounts():
+    await run_in_threadpool(purge_deleted_users)
+
+@app.on_event("startup")
+async def build_name_prefilter():
+    # Subscribe before the scan starts, so names taken while it runs are
+    # replayed into the new filters rather than missed
+    app.state.prefilter_listener = asyncio.create_task(name_prefilter.listen())
+    await name_prefilter.wait_until_subscribed()
+    await name_prefilter.rebuild()
+    app.state.prefilter_resync = asyncio.create_task(name_prefilter.resync())
+
+@app.on_event("startup")
+async def build_host_resolver():
+    # As above: subscribed before the scan, so no update falls in between
+    app.state.host_listener = asyncio.create_task(host_resolver.listen())
+    await host_resolver.wait_until_subscribed()
+    await host_resolver.rebuild()
+    app.state.host_resync = asyncio.create_task(host_resolver.resync())
+
+@app.on_event("startup")
+async def start_traffic_flusher():
+    app.state.traffic_flusher = asyncio.create_task(traffic_counter.run())
+
+@app.on_event("shutdown")
+async def flush_traffic():
+    await traffic_counter.flush()
+
+# Replay stored responses for retried writes carrying an Idempotency-Key
+@app.middleware("http")
+async def idempotency_middleware(request: Request, call_next):
+    return await idempotent_call(request, call_next)
+
+# Pin users to the primary right after they write (read-your-writes)
+@app.middleware("http")
+async def read_your_writes_middleware(request: Request, call_next):
+    response = await call_next(request)
     
-    # Extract subdomain
-    subdomain_match = re.match(r'^([^.]+)\.myluminarasystem\.pro', host)
+    if (settings.READ_REPLICA_URLS and request.method not in SAFE_METHODS
+            and response.status_code < 400):
+        await mark_recent_write(request)
     
-    if subdomain_match:
-        subdomain = subdomain_match.group(1)
-        # Skip API subdomains
-        if subdomain not in ["api", "www", "admin"]:
-            request.state.subdomain = subdomain
-        else:
-            request.state.subdomain = None
-    else:
-        request.state.subdomain = None
+    return response
+
+# Opt-in statistical profiling of single requests
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    if not should_profile(request.headers.get("x-profile-token")):
+        return await call_next(request)
     
-    response = await call_next(request)
+    profiler = RequestProfiler()
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profile = profiler.stop(request.method, request.url.path)
+    
+    profile_id = await save_profile(profile)
+    if profile_id is not None:
+        response.headers["X-Profile-ID"] = profile_id
     return response
 
+# One server span per request; DB, HTTP, SMTP and bcrypt spans nest under it
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    with tracer.span(f"{request.method} {request.url.path}", {"http.method": request.method}) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            # The route template groups spans across path parameters
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.status_code", response.status_code)
+        return response
+
+# Per-route-class adaptive concurrency limits with priority shedding
+@app.middleware("http")
+async def load_shedding_middleware(request: Request, call_next):
+    return await shed_or_call(request, call_next)
+
+# gzip/brotli for larger bodies; ETagged (cached) bodies are compressed once
+@app.middleware("http")
+async def compression_middleware(request: Request, call_next):
+    return await compress_response(request, call_next)
+
+# Request ids and sampled access logs (outermost, so it times everything)
+@app.middleware("http")
+async def request_context_middleware(request: Request, call_next):
+    request_id = request.headers.get("x-request-id", "")[:64] or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    started = time.perf_counter()
+    status_code = 500
+    
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        access_logger.info(
+            "%s %s", request.method, request.url.path,
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+        )
+    
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+# CORS middleware (added last so it is outermost: preflights are answered
+# before any other middleware runs)
+app.add_middleware(
+    TenantCORSMiddleware,
+    allow_origins=settings.CORS_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    max_age=settings.CORS_MAX_AGE,
+)
+
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/users", tags=["Users"])
 app.include_router(subdomains.router, prefix="/subdomains", tags=["Subdomains"])
+app.include_router(profiles.router, prefix="/debug/profiles", tags=["Debug"])
 
-@app.get("/")
-async def root(request: Request):
-    subdomain = getattr(request.state, 'subdomain', None)
-    
+@lru_cache(maxsize=4096)
+def root_body(subdomain: Optional[str]) -> bytes:
     if subdomain:
-        return {
+        return encode({
             "message": f"Welcome to {subdomain}'s site",
             "subdomain": subdomain,
             "type": "user_site"
-        }
+        })
     else:
-        return {
+        return encode({
             "message": "Welcome to Luminara Systems",
             "api_version": "1.0.0",
             "type": "main_site"
-        }
+        })
+
+@app.get("/")
+async def root(request: Request):
+    subdomain = getattr(request.state, 'subdomain', None)
+    return conditional_response(request, root_body(subdomain))
 
 @app.get("/health")
 async def health_check():
@@ -81,6 +202,10 @@ async def health_check():
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
+    logger.error(
+        "Unhandled error on %s %s", request.method, request.url.path,
+        exc_info=(type(exc), exc, exc.__traceback__)
+    )
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error", "type": "server_error"}
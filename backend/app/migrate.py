@@ -0,0 +1,41 @@
+import logging
+import os
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+from .database import engine
+
+# Alembic owns the schema. Run before starting the app:
+#
+#     python -m app.migrate
+#
+# Databases the app created for itself with create_all (before migrations
+# existed) have no alembic_version table; they are stamped at the baseline,
+# which matches that schema, and then upgraded like any other.
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+BASELINE_REVISION = "0f3b2a1c9d7e"
+
+# Arbitrary key for pg_advisory_xact_lock, shared by every replica
+MIGRATION_LOCK_KEY = 0x4C756D31
+
+def migrate():
+    alembic_config = Config(ALEMBIC_INI)
+    with engine.begin() as connection:
+        # Replicas starting together take turns; the lock is released at
+        # commit, so it also works through PgBouncer in transaction mode
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        alembic_config.attributes["connection"] = connection
+
+        tables = set(inspect(connection).get_table_names())
+        if "users" in tables and "alembic_version" not in tables:
+            logger.info("Stamping unversioned database at baseline %s", BASELINE_REVISION)
+            command.stamp(alembic_config, BASELINE_REVISION)
+        command.upgrade(alembic_config, "head")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate()
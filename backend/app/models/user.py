@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Boolean, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
@@ -15,17 +15,18 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)  # Email verification status
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    deleted_at = Column(DateTime(timezone=True), nullable=True)  # Set on soft delete, purged later
     
-    # Relationships
-    subdomains = relationship("Subdomain", back_populates="owner")
-    admin_tokens = relationship("AdminToken", back_populates="user")
-    email_verifications = relationship("EmailVerification", back_populates="user")
+    # Relationships (children are removed by ON DELETE CASCADE, not by the ORM)
+    subdomains = relationship("Subdomain", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
+    admin_tokens = relationship("AdminToken", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    email_verifications = relationship("EmailVerification", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 class EmailVerification(Base):
     __tablename__ = "email_verifications"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
     token = Column(String, unique=True, index=True, nullable=False)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     is_used = Column(Boolean, default=False)
@@ -38,20 +39,54 @@ class Subdomain(Base):
     __tablename__ = "subdomains"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
     subdomain = Column(String, unique=True, index=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     owner = relationship("User", back_populates="subdomains")
+    custom_domains = relationship("CustomDomain", back_populates="subdomain", cascade="all, delete-orphan", passive_deletes=True)
+
+class CustomDomain(Base):
+    __tablename__ = "custom_domains"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    subdomain_id = Column(Integer, ForeignKey("subdomains.id", ondelete="CASCADE"), index=True, nullable=False)
+    domain = Column(String, index=True, nullable=False)  # Lowercase host, no port
+    verification_token = Column(String, nullable=False)  # Expected in the DNS TXT challenge record
+    verified_at = Column(DateTime(timezone=True), nullable=True)  # Only verified domains are served
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    subdomain = relationship("Subdomain", back_populates="custom_domains")
+    
+    __table_args__ = (
+        UniqueConstraint("subdomain_id", "domain", name="uq_custom_domains_subdomain_domain"),
+        # Several tenants may have a pending claim, but only one can verify it
+        Index(
+            "uq_custom_domains_verified_domain", "domain",
+            unique=True, postgresql_where=verified_at.isnot(None)
+        ),
+    )
 
 class AdminToken(Base):
     __tablename__ = "admin_tokens"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
     token_hash = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     user = relationship("User", back_populates="admin_tokens")
+
+class TenantTraffic(Base):
+    __tablename__ = "tenant_traffic"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    subdomain_id = Column(Integer, ForeignKey("subdomains.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    requests = Column(BigInteger, nullable=False, default=0)
+    unique_visitors = Column(Integer, nullable=False, default=0)  # HyperLogLog estimate
+    
+    __table_args__ = (UniqueConstraint("subdomain_id", "day", name="uq_tenant_traffic_subdomain_day"),)
@@ -0,0 +1,136 @@
+import re
+import unicodedata
+from typing import Iterable, List, Optional
+
+from .config import settings
+
+# Shared rules for usernames and subdomains. Everything is compiled once at
+# import, so a check is a regex match, a set lookup and one pass over the
+# name's skeleton.
+
+USERNAME_RE = re.compile(r"[a-zA-Z0-9_-]{3,20}")
+SUBDOMAIN_RE = re.compile(r"[a-zA-Z0-9]([a-zA-Z0-9-]{1,28}[a-zA-Z0-9])?")
+CUSTOM_DOMAIN_RE = re.compile(r"(?=.{4,253}$)([a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}")
+
+RESERVED_SUBDOMAINS = frozenset({
+    "www", "api", "admin", "app", "mail", "ftp", "blog", "shop", "store",
+    "support", "help", "about", "contact", "news", "dev", "test", "staging",
+})
+RESERVED_USERNAMES = frozenset({
+    "admin", "administrator", "root", "system", "support", "staff", "moderator",
+    "luminara", "api", "www",
+})
+
+# Characters that read as the same letter are folded onto one representative,
+# on both the blocklist and the name, so "4dm1n", "adm|n" and Cyrillic
+# "аdmin" all share the skeleton of "admin". Ambiguous glyphs (1, l, |, i)
+# fold together rather than being guessed at.
+CONFUSABLES = str.maketrans({
+    "0": "o", "1": "i", "l": "i", "|": "i", "!": "i", "3": "e", "4": "a",
+    "@": "a", "5": "s", "$": "s", "7": "t", "8": "b", "9": "g",
+    # Cyrillic and Greek lookalikes
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h", "о": "o",
+    "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j",
+    "ѕ": "s", "α": "a", "β": "b", "ε": "e", "ι": "i", "κ": "k", "ν": "v",
+    "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x",
+    # Separators don't break up a word
+    "-": None, "_": None, ".": None, " ": None,
+})
+
+def skeleton(name: str) -> str:
+    # NFKC folds fullwidth and other compatibility forms before the table
+    return unicodedata.normalize("NFKC", name).lower().translate(CONFUSABLES)
+
+class BlocklistMatcher:
+    # Aho-Corasick automaton: finds whether any blocked term occurs anywhere
+    # in a name in one pass, however many terms there are
+
+    def __init__(self, terms: Iterable[str]):
+        self.goto = [{}]
+        self.fail = [0]
+        self.match: List[Optional[str]] = [None]
+        self.size = 0
+
+        for term in terms:
+            self._insert(term)
+        self._link()
+
+    def _insert(self, term: str):
+        node = 0
+        for char in term:
+            nxt = self.goto[node].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.match.append(None)
+            node = nxt
+        if self.match[node] is None:
+            self.match[node] = term
+            self.size += 1
+
+    def _link(self):
+        # Breadth-first, so each node's fail target is already final
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                target = self.fail[node]
+                while target and char not in self.goto[target]:
+                    target = self.fail[target]
+                self.fail[child] = self.goto[target].get(char, 0)
+                if self.match[child] is None:
+                    self.match[child] = self.match[self.fail[child]]
+
+    def find(self, text: str) -> Optional[str]:
+        goto, fail, match = self.goto, self.fail, self.match
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if match[node] is not None:
+                return match[node]
+        return None
+
+def load_blocklist(path: str) -> List[str]:
+    # One term per line; blank lines and "#" comments are ignored
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        terms = (line.split("#", 1)[0].strip() for line in f)
+        return [skeleton(term) for term in terms if term]
+
+blocklist = BlocklistMatcher(load_blocklist(settings.NAME_BLOCKLIST_PATH))
+
+def _check(name: str, pattern: re.Pattern, reserved: frozenset) -> Optional[str]:
+    if not pattern.fullmatch(name):
+        return "Invalid format"
+    # Reserved words are short and common, so folding lookalikes would take
+    # ordinary names with them ("apl" -> "api"); only the case is ignored
+    if name.lower() in reserved:
+        return "Reserved name"
+    if blocklist.find(skeleton(name)) is not None:
+        return "Name not allowed"
+    return None
+
+# check_* return a short reason the name is rejected, or None if it is allowed
+
+def check_username(username: str) -> Optional[str]:
+    return _check(username, USERNAME_RE, RESERVED_USERNAMES)
+
+def check_subdomain(subdomain: str) -> Optional[str]:
+    return _check(subdomain, SUBDOMAIN_RE, RESERVED_SUBDOMAINS)
+
+def validate_username(username: str) -> bool:
+    return check_username(username) is None
+
+def validate_subdomain(subdomain: str) -> bool:
+    return check_subdomain(subdomain) is None
+
+def validate_custom_domain(domain: str) -> bool:
+    # A hostname outside the platform's own domain; tenants own their domain
+    # names, so the blocklist doesn't apply
+    root = settings.ROOT_DOMAIN
+    return bool(CUSTOM_DOMAIN_RE.fullmatch(domain)) and domain != root and not domain.endswith("." + root)
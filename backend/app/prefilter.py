@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import logging
+import math
+from fastapi.concurrency import run_in_threadpool
+from redis.exceptions import RedisError
+
+from .cache import redis_client
+from .config import settings
+from .database import SessionLocal
+from .models.user import User, Subdomain
+
+logger = logging.getLogger(__name__)
+
+# Other workers publish names they have just taken on this channel
+PREFILTER_CHANNEL = "prefilter:add"
+
+KINDS = ("subdomain", "username", "email", "identity")
+
+# How long startup waits for the listener before building the filters anyway
+SUBSCRIBE_TIMEOUT_SECONDS = 5
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+# Per-worker filter of taken names. A negative answer means the name is
+# definitely free; a positive one only means "maybe" and must be confirmed
+# against the database.
+def _empty_filters():
+    return {kind: BloomFilter(settings.PREFILTER_CAPACITY, settings.PREFILTER_ERROR_RATE) for kind in KINDS}
+
+class NamePrefilter:
+    def __init__(self):
+        self.filters = _empty_filters()
+        self.ready = False
+        # Collects names added while a rebuild scan is running
+        self._replay = None
+        self._rebuild_lock = asyncio.Lock()
+        # Set once the listener is subscribed and will replay what it hears
+        self.subscribed = asyncio.Event()
+
+    def might_exist(self, kind: str, value: str) -> bool:
+        # Until the startup scan finishes every answer has to be "maybe"
+        if not self.ready or value is None:
+            return True
+        return value in self.filters[kind]
+
+    def _add_local(self, kind: str, value: str):
+        if value is not None:
+            self.filters[kind].add(value)
+            if self._replay is not None:
+                self._replay.append((kind, value))
+
+    async def add(self, kind: str, value: str):
+        self._add_local(kind, value)
+        try:
+            await redis_client.publish(PREFILTER_CHANNEL, f"{kind}:{value}")
+        except RedisError:
+            # Peers fall back to the database's unique constraints
+            pass
+
+    def _scan(self):
+        # Stream the tables into fresh filters instead of loading them at once
+        filters = _empty_filters()
+        db = SessionLocal()
+        try:
+            rows = db.query(User.username, User.email, User.provider, User.provider_id).yield_per(5000)
+            for username, email, provider, provider_id in rows:
+                filters["username"].add(username)
+                filters["email"].add(email)
+                if provider_id:
+                    filters["identity"].add(f"{provider}:{provider_id}")
+            
+            for (name,) in db.query(Subdomain.subdomain).yield_per(5000):
+                filters["subdomain"].add(name)
+        finally:
+            db.close()
+        return filters
+
+    async def rebuild(self):
+        # Names announced during the scan are replayed into the new filters;
+        # the swap runs on the event loop, so none can slip in between
+        async with self._rebuild_lock:
+            self._replay = []
+            try:
+                filters = await run_in_threadpool(self._scan)
+                for kind, value in self._replay:
+                    filters[kind].add(value)
+            finally:
+                self._replay = None
+            self.filters = filters
+            self.ready = True
+
+    async def _rebuild_logged(self):
+        try:
+            await self.rebuild()
+        except Exception:
+            # Keep the current filters; the next resync tries again
+            logger.exception("Name prefilter rebuild failed")
+
+    async def wait_until_subscribed(self, timeout: float = SUBSCRIBE_TIMEOUT_SECONDS):
+        try:
+            await asyncio.wait_for(self.subscribed.wait(), timeout)
+        except asyncio.TimeoutError:
+            # Redis is down; build without it and let the listener rebuild
+            # once it gets through
+            logger.warning("Name prefilter listener not subscribed after %ss", timeout)
+
+    async def listen(self):
+        while True:
+            try:
+                pubsub = redis_client.pubsub()
+                await pubsub.subscribe(PREFILTER_CHANNEL)
+                self.subscribed.set()
+                if self.ready:
+                    # The filters were built without us listening (a
+                    # reconnect, or Redis was down at startup); names
+                    # announced meanwhile are gone and would look free
+                    await self._rebuild_logged()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    kind, _, value = message["data"].decode().partition(":")
+                    if kind in self.filters:
+                        self._add_local(kind, value)
+            except RedisError:
+                await asyncio.sleep(5)
+
+    async def resync(self):
+        # Backstop for anything pub/sub dropped without a disconnect
+        while True:
+            await asyncio.sleep(settings.PREFILTER_RESYNC_SECONDS)
+            await self._rebuild_logged()
+
+name_prefilter = NamePrefilter()
@@ -0,0 +1,164 @@
+import collections
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+import orjson
+from jose import JWTError, jwt
+from redis.exceptions import RedisError
+
+from .cache import redis_client
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Profiles live in Redis so any worker can serve any of them: one hash per
+# profile, plus a list of ids, newest first, trimmed to PROFILE_STORE_SIZE
+PROFILE_KEY = "profile:{}"
+PROFILE_INDEX_KEY = "profiles"
+
+PROFILE_SCOPE = "profile"
+
+def create_profile_token(expires_hours: int = 24) -> str:
+    # Signed with the app secret, so only operators can mint one
+    expire = datetime.utcnow() + timedelta(hours=expires_hours)
+    return jwt.encode({"scope": PROFILE_SCOPE, "exp": expire}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def verify_profile_token(token: Optional[str]) -> bool:
+    if not token:
+        return False
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("scope") == PROFILE_SCOPE
+
+def should_profile(token: Optional[str]) -> bool:
+    if token is not None:
+        return verify_profile_token(token)
+    return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+class RequestProfiler:
+    # Statistical profiler: a helper thread samples the event loop thread's
+    # stack at a fixed interval while one request is in flight. Other
+    # requests sharing the loop can show up in the samples too.
+
+    def __init__(self, interval_ms: int = settings.PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.target = threading.get_ident()
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self._thread.start()
+
+    def stop(self, method: str, path: str) -> dict:
+        self._stop.set()
+        self._thread.join()
+        return {
+            "id": uuid.uuid4().hex,
+            "method": method,
+            "path": path,
+            # Each worker samples only its own requests
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "interval_ms": self.interval * 1000,
+            "samples": sum(self.stacks.values()),
+            "stacks": self.stacks,
+        }
+
+async def save_profile(profile: dict) -> Optional[str]:
+    # Returns the profile's id, or None if it couldn't be stored
+    profile_id = profile["id"]
+    key = PROFILE_KEY.format(profile_id)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={
+                "summary": orjson.dumps(profile_summary(profile)),
+                "stacks": orjson.dumps(profile["stacks"]),
+            })
+            pipe.expire(key, settings.PROFILE_TTL_SECONDS)
+            pipe.lpush(PROFILE_INDEX_KEY, profile_id)
+            pipe.ltrim(PROFILE_INDEX_KEY, 0, settings.PROFILE_STORE_SIZE - 1)
+            await pipe.execute()
+    except RedisError:
+        logger.warning("Could not store profile %s", profile_id, exc_info=True)
+        return None
+    return profile_id
+
+async def list_profile_summaries() -> List[dict]:
+    profile_ids = await redis_client.lrange(PROFILE_INDEX_KEY, 0, -1)
+    if not profile_ids:
+        return []
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for profile_id in profile_ids:
+            pipe.hget(PROFILE_KEY.format(profile_id.decode()), "summary")
+        summaries = await pipe.execute()
+    # Ids outlive their profiles until the list is trimmed past them
+    return [orjson.loads(summary) for summary in summaries if summary is not None]
+
+async def load_profile(profile_id: str) -> Optional[dict]:
+    stored = await redis_client.hgetall(PROFILE_KEY.format(profile_id))
+    if not stored:
+        return None
+    profile = orjson.loads(stored[b"summary"])
+    profile["stacks"] = collections.Counter(orjson.loads(stored[b"stacks"]))
+    return profile
+
+def profile_summary(profile: dict) -> dict:
+    return {k: v for k, v in profile.items() if k != "stacks"}
+
+def to_collapsed(profile: dict) -> str:
+    # Brendan Gregg's folded format: "root;child;leaf count" per line
+    return "\n".join(f"{stack} {count}" for stack, count in profile["stacks"].most_common())
+
+def to_speedscope(profile: dict) -> dict:
+    frames = {}
+    samples = []
+    weights = []
+    for stack, count in profile["stacks"].items():
+        samples.append([frames.setdefault(name, len(frames)) for name in stack.split(";")])
+        weights.append(count * profile["interval_ms"])
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": [{"name": name} for name in frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": f"{profile['method']} {profile['path']}",
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+if __name__ == "__main__":
+    # python -m app.profiler token -> prints a header value for X-Profile-Token
+    if sys.argv[1:] == ["token"]:
+        print(create_profile_token())
+    else:
+        print("usage: python -m app.profiler token")
@@ -0,0 +1,25 @@
+from .database import SessionLocal
+from .models.user import User
+
+# Hard deletes run outside the request; child rows go with the user through
+# ON DELETE CASCADE, so each purge is a single DELETE statement.
+
+def purge_user(user_id: int):
+    db = SessionLocal()
+    try:
+        db.query(User).filter(
+            User.id == user_id,
+            User.deleted_at.isnot(None)
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def purge_deleted_users():
+    # Catch up on purges lost to a restart between soft delete and purge
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.deleted_at.isnot(None)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
@@ -1,23 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import RedirectResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+from typing import Optional
 from ..database import get_db
 from ..models.user import User, EmailVerification
 from ..schemas.auth import UserSignup, UserLogin, Token, EmailVerificationRequest
 from ..auth.jwt import create_access_token, get_password_hash, verify_password
 from ..auth.oauth import github_oauth, discord_oauth
+from ..auth.oauth_state import BINDING_COOKIE, OAuthStateError, issue_state, run_callback_once, state_binding
 from ..auth.email import email_service
+from ..cache import PROFILE_KEY, invalidate
 from ..config import settings
+from ..name_policy import check_username, validate_username
+from ..prefilter import name_prefilter
+import logging
 import secrets
 import re
 
 router = APIRouter()
-
-def validate_username(username: str) -> bool:
-    # Username must be 3-20 chars, alphanumeric + underscore/dash
-    pattern = r'^[a-zA-Z0-9_-]{3,20}$'
-    return bool(re.match(pattern, username))
+logger = logging.getLogger(__name__)
 
 def validate_password(password: str) -> bool:
     # At least 8 chars, 1 uppercase, 1 lowercase, 1 number
@@ -34,11 +37,14 @@ def validate_password(password: str) -> bool:
 @router.post("/signup", response_model=dict)
 async def email_signup(user_data: UserSignup, db: Session = Depends(get_db)):
     # Validate username
-    if not validate_username(user_data.username):
+    problem = check_username(user_data.username)
+    if problem == "Invalid format":
         raise HTTPException(
             status_code=400, 
             detail="Username must be 3-20 characters long and contain only letters, numbers, underscores, or dashes"
         )
+    if problem:
+        raise HTTPException(status_code=400, detail="This username is not available")
     
     # Validate password
     if not validate_password(user_data.password):
@@ -47,16 +53,18 @@ async def email_signup(user_data: UserSignup, db: Session = Depends(get_db)):
             detail="Password must be at least 8 characters with uppercase, lowercase, and number"
         )
     
-    # Check if user already exists
-    existing_user = db.query(User).filter(
-        (User.email == user_data.email) | (User.username == user_data.username)
-    ).first()
-    
-    if existing_user:
-        if existing_user.email == user_data.email:
-            raise HTTPException(status_code=400, detail="Email already registered")
-        else:
-            raise HTTPException(status_code=400, detail="Username already taken")
+    # Check if user already exists (skipped when the prefilter says both are free)
+    if (name_prefilter.might_exist("email", user_data.email)
+            or name_prefilter.might_exist("username", user_data.username)):
+        existing_user = db.query(User).filter(
+            (User.email == user_data.email) | (User.username == user_data.username)
+        ).first()
+        
+        if existing_user:
+            if existing_user.email == user_data.email:
+                raise HTTPException(status_code=400, detail="Email already registered")
+            else:
+                raise HTTPException(status_code=400, detail="Username already taken")
     
     # Create user
     hashed_password = get_password_hash(user_data.password)
@@ -69,8 +77,16 @@ async def email_signup(user_data: UserSignup, db: Session = Depends(get_db)):
     )
     
     db.add(user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Taken by another worker after our prefilter was last updated
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Email or username already registered")
     db.refresh(user)
+    await name_prefilter.add("email", user.email)
+    await name_prefilter.add("username", user.username)
+    await invalidate(PROFILE_KEY.format(user.username))  # Drop any cached "not found"
     
     # Create verification token
     verification_token = secrets.token_urlsafe(32)
@@ -104,7 +120,8 @@ async def email_signup(user_data: UserSignup, db: Session = Depends(get_db)):
 async def email_login(user_data: UserLogin, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == user_data.email).first()
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    if (not user or user.deleted_at is not None
+            or not verify_password(user_data.password, user.hashed_password)):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
@@ -176,83 +193,132 @@ async def resend_verification(request: EmailVerificationRequest, db: Session = D
     
     return {"message": "Verification email sent successfully"}
 
-# OAuth routes (GitHub and Discord - keeping previous code)
+def oauth_username(db: Session, preferred: str) -> str:
+    # Provider logins follow their own rules and may already be taken here,
+    # so fall back to a suffixed or generated name that passes our policy
+    preferred = re.sub(r"[^a-zA-Z0-9_-]", "", preferred or "")
+    candidates = [preferred, f"{preferred[:13]}-{secrets.token_hex(3)}", f"user-{secrets.token_hex(6)}"]
+    for candidate in candidates:
+        if not validate_username(candidate):
+            continue
+        if (not name_prefilter.might_exist("username", candidate)
+                or db.query(User.id).filter(User.username == candidate).first() is None):
+            return candidate
+    return candidates[-1]
+
+def find_oauth_user(db: Session, provider: str, user_info: dict):
+    return db.query(User).filter(
+        (User.email == user_info["email"]) | 
+        ((User.provider_id == user_info["id"]) & (User.provider == provider))
+    ).first()
+
+async def get_or_create_oauth_user(db: Session, provider: str, user_info: dict) -> User:
+    identity = f"{provider}:{user_info['id']}"
+    user = None
+    
+    # Brand new accounts are definitely absent from both filters
+    if (name_prefilter.might_exist("email", user_info["email"])
+            or name_prefilter.might_exist("identity", identity)):
+        user = find_oauth_user(db, provider, user_info)
+    
+    if user and user.deleted_at is not None:
+        raise HTTPException(status_code=400, detail="This account has been deleted")
+    
+    # A concurrent login can create the account, or take the username we
+    # picked, between our check and the insert: look again, then retry once
+    # with a fresh name
+    attempts = 2
+    while not user:
+        user = User(
+            email=user_info["email"],
+            username=oauth_username(db, user_info["username"]),
+            provider=provider,
+            provider_id=user_info["id"],
+            is_verified=True  # OAuth users are auto-verified
+        )
+        db.add(user)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            user = find_oauth_user(db, provider, user_info)
+            if user:
+                if user.deleted_at is not None:
+                    raise HTTPException(status_code=400, detail="This account has been deleted")
+                return user
+            attempts -= 1
+            if not attempts:
+                raise HTTPException(status_code=409, detail="Could not create the account, please try again")
+            continue
+        db.refresh(user)
+        await name_prefilter.add("email", user.email)
+        await name_prefilter.add("username", user.username)
+        await name_prefilter.add("identity", identity)
+        await invalidate(PROFILE_KEY.format(user.username))
+    
+    return user
+
+async def exchange_oauth_code(client, provider: str, code: str, db: Session) -> str:
+    token_data = await client.get_access_token(code)
+    access_token = token_data.get("access_token")
+    
+    if not access_token:
+        raise HTTPException(status_code=400, detail="Failed to get access token")
+    
+    user_info = await client.get_user_info(access_token)
+    
+    user = await get_or_create_oauth_user(db, provider, user_info)
+    
+    return create_access_token(data={"sub": user.username})
+
+# OAuth routes (GitHub and Discord). The browser navigates here directly, so
+# the state-binding cookie lands on the API's own site.
+def oauth_start(provider: str, client, state: str) -> RedirectResponse:
+    response = RedirectResponse(client.get_authorize_url(state))
+    response.set_cookie(
+        BINDING_COOKIE,
+        state_binding(provider, state),
+        max_age=settings.OAUTH_STATE_TTL_SECONDS,
+        path="/auth",
+        httponly=True,
+        secure=settings.BASE_URL.startswith("https://"),
+        samesite="lax"  # Sent on the provider's top-level redirect back
+    )
+    return response
+
+async def oauth_finish(request: Request, provider: str, client, code: str, state: Optional[str], db: Session):
+    try:
+        jwt_token = await run_callback_once(
+            provider, code, state, request.cookies.get(BINDING_COOKIE),
+            lambda: exchange_oauth_code(client, provider, code, db)
+        )
+    except OAuthStateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception:
+        # Provider and database errors stay in the logs, not in the response
+        logger.exception("%s OAuth callback failed", provider)
+        raise HTTPException(status_code=400, detail="OAuth login failed")
+    
+    response = RedirectResponse(f"http://localhost:3000/auth/callback?token={jwt_token}")
+    response.delete_cookie(BINDING_COOKIE, path="/auth")
+    return response
+
 @router.get("/github")
 async def github_login():
-    state = secrets.token_urlsafe(32)
-    auth_url = github_oauth.get_authorize_url(state)
-    return {"auth_url": auth_url}
+    state = await issue_state("github")
+    return oauth_start("github", github_oauth, state)
 
 @router.get("/github/callback")
-async def github_callback(code: str, state: str = None, db: Session = Depends(get_db)):
-    try:
-        token_data = await github_oauth.get_access_token(code)
-        access_token = token_data.get("access_token")
-        
-        if not access_token:
-            raise HTTPException(status_code=400, detail="Failed to get access token")
-        
-        user_info = await github_oauth.get_user_info(access_token)
-        
-        user = db.query(User).filter(
-            (User.email == user_info["email"]) | 
-            ((User.provider_id == user_info["id"]) & (User.provider == "github"))
-        ).first()
-        
-        if not user:
-            user = User(
-                email=user_info["email"],
-                username=user_info["username"],
-                provider="github",
-                provider_id=user_info["id"],
-                is_verified=True  # OAuth users are auto-verified
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        
-        jwt_token = create_access_token(data={"sub": user.username})
-        return RedirectResponse(f"http://localhost:3000/auth/callback?token={jwt_token}")
-        
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+async def github_callback(request: Request, code: str, state: str = None, db: Session = Depends(get_db)):
+    return await oauth_finish(request, "github", github_oauth, code, state, db)
 
 @router.get("/discord")
 async def discord_login():
-    state = secrets.token_urlsafe(32)
-    auth_url = discord_oauth.get_authorize_url(state)
-    return {"auth_url": auth_url}
+    state = await issue_state("discord")
+    return oauth_start("discord", discord_oauth, state)
 
 @router.get("/discord/callback")
-async def discord_callback(code: str, state: str = None, db: Session = Depends(get_db)):
-    try:
-        token_data = await discord_oauth.get_access_token(code)
-        access_token = token_data.get("access_token")
-        
-        if not access_token:
-            raise HTTPException(status_code=400, detail="Failed to get access token")
-        
-        user_info = await discord_oauth.get_user_info(access_token)
-        
-        user = db.query(User).filter(
-            (User.email == user_info["email"]) | 
-            ((User.provider_id == user_info["id"]) & (User.provider == "discord"))
-        ).first()
-        
-        if not user:
-            user = User(
-                email=user_info["email"],
-                username=user_info["username"],
-                provider="discord",
-                provider_id=user_info["id"],
-                is_verified=True  # OAuth users are auto-verified
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        
-        jwt_token = create_access_token(data={"sub": user.username})
-        return RedirectResponse(f"http://localhost:3000/auth/callback?token={jwt_token}")
-        
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+async def discord_callback(request: Request, code: str, state: str = None, db: Session = Depends(get_db)):
+    return await oauth_finish(request, "discord", discord_oauth, code, state, db)
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from redis.exceptions import RedisError
+from typing import Optional
+
+from ..profiler import list_profile_summaries, load_profile, to_collapsed, to_speedscope, verify_profile_token
+
+router = APIRouter()
+
+async def require_profile_token(x_profile_token: Optional[str] = Header(None)):
+    if not verify_profile_token(x_profile_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="A valid X-Profile-Token header is required"
+        )
+
+def store_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Profile store unavailable"
+    )
+
+@router.get("/", dependencies=[Depends(require_profile_token)])
+async def list_profiles():
+    try:
+        return await list_profile_summaries()
+    except RedisError:
+        raise store_unavailable()
+
+@router.get("/{profile_id}", dependencies=[Depends(require_profile_token)])
+async def get_profile(profile_id: str, format: str = "speedscope"):
+    try:
+        profile = await load_profile(profile_id)
+    except RedisError:
+        raise store_unavailable()
+    
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "collapsed":
+        return PlainTextResponse(to_collapsed(profile))
+    
+    return to_speedscope(profile)
@@ -1,32 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from datetime import datetime, timedelta, timezone
 from typing import List
-import re
+import asyncio
+import orjson
 import secrets
+import time
 
-from ..database import get_db
-from ..models.user import User, Subdomain, AdminToken
+from ..cache import SUBDOMAIN_KEY, get_or_load, invalidate
+from ..config import settings
+from ..database import get_db, get_read_db, open_read_session
+from ..domain_verification import challenge_name, has_challenge, new_token
+from ..http_cache import conditional_response
+from ..host_resolver import host_resolver, normalize_host
+from ..models.user import User, Subdomain, AdminToken, TenantTraffic, CustomDomain
+from ..name_policy import check_subdomain, check_username, validate_subdomain, validate_custom_domain
+from ..prefilter import name_prefilter
 from ..routes.users import get_current_user
 from ..schemas.subdomains import (
     SubdomainCreate, 
     SubdomainResponse, 
     AdminTokenResponse,
-    SubdomainUpdate
+    SubdomainUpdate,
+    CustomDomainCreate,
+    CustomDomainResponse
 )
+from ..serializers import subdomain_payload, custom_domain_payload, encode, json_response
+from ..suggestions import suggest_subdomains
+from ..tenant_map import update_tenant_map
 
 router = APIRouter()
 
-def validate_subdomain(subdomain: str) -> bool:
-    # Subdomain must be 3-30 chars, alphanumeric + dash, can't start/end with dash
-    pattern = r'^[a-zA-Z0-9]([a-zA-Z0-9-]{1,28}[a-zA-Z0-9])?$'
-    
-    # Reserved subdomains
-    reserved = [
-        'www', 'api', 'admin', 'app', 'mail', 'ftp', 'blog', 'shop', 'store',
-        'support', 'help', 'about', 'contact', 'news', 'dev', 'test', 'staging'
+def custom_hosts(db: Session, subdomain_id: int) -> List[str]:
+    # Verified domains only: a pending claim never routes anywhere, and the
+    # same host may be verified by another tenant
+    return [
+        domain for (domain,) in db.query(CustomDomain.domain).filter(
+            CustomDomain.subdomain_id == subdomain_id,
+            CustomDomain.verified_at.isnot(None)
+        )
     ]
-    
-    return bool(re.match(pattern, subdomain)) and subdomain.lower() not in reserved
+
+def taken_detail(db: Session, name: str, username: str) -> dict:
+    # Same suggestion list as the check endpoint, so clients needn't parse prose
+    return {"message": "Subdomain already taken", "suggestions": suggest_subdomains(db, name, username)}
 
 @router.post("/", response_model=SubdomainResponse)
 async def create_subdomain(
@@ -38,7 +58,7 @@ async def create_subdomain(
     if not validate_subdomain(subdomain_data.subdomain):
         raise HTTPException(
             status_code=400,
-            detail="Invalid subdomain format. Must be 3-30 characters, alphanumeric with dashes, cannot start/end with dash, and cannot be a reserved word."
+            detail="Invalid subdomain format. Must be 3-30 characters, alphanumeric with dashes, cannot start/end with dash, and cannot be a reserved or blocked word."
         )
     
     # Check if user already has a subdomain
@@ -52,34 +72,41 @@ async def create_subdomain(
             detail="You already have a subdomain. Each user can only have one subdomain."
         )
     
-    # Check if subdomain is available
-    existing = db.query(Subdomain).filter(
-        Subdomain.subdomain == subdomain_data.subdomain.lower()
-    ).first()
-    
-    if existing:
-        raise HTTPException(
-            status_code=400,
-            detail="Subdomain already taken"
-        )
+    # Check if subdomain is available (a prefilter miss means it is definitely free)
+    name = subdomain_data.subdomain.lower()
+    if name_prefilter.might_exist("subdomain", name):
+        existing = db.query(Subdomain).filter(
+            Subdomain.subdomain == name
+        ).first()
+        
+        if existing:
+            raise HTTPException(
+                status_code=400,
+                detail=taken_detail(db, name, current_user.username)
+            )
     
     # Create subdomain
     subdomain = Subdomain(
         user_id=current_user.id,
-        subdomain=subdomain_data.subdomain.lower()
+        subdomain=name
     )
     
     db.add(subdomain)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker took the name after our prefilter was last updated
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=taken_detail(db, name, current_user.username)
+        )
     db.refresh(subdomain)
+    await name_prefilter.add("subdomain", name)
+    await invalidate(SUBDOMAIN_KEY.format(name))  # Drop any cached "not found"
+    await run_in_threadpool(update_tenant_map, add=[name])
     
-    return SubdomainResponse(
-        id=subdomain.id,
-        subdomain=subdomain.subdomain,
-        full_url=f"https://{subdomain.subdomain}.myluminarasystem.pro",
-        created_at=subdomain.created_at.isoformat(),
-        owner_username=current_user.username
-    )
+    return json_response(encode(subdomain_payload(subdomain, current_user.username)))
 
 @router.get("/my", response_model=SubdomainResponse)
 async def get_my_subdomain(
@@ -96,21 +123,16 @@ async def get_my_subdomain(
             detail="You don't have a subdomain yet"
         )
     
-    return SubdomainResponse(
-        id=subdomain.id,
-        subdomain=subdomain.subdomain,
-        full_url=f"https://{subdomain.subdomain}.myluminarasystem.pro",
-        created_at=subdomain.created_at.isoformat(),
-        owner_username=current_user.username
-    )
+    return json_response(encode(subdomain_payload(subdomain, current_user.username)))
 
-@router.get("/check/{subdomain}")
-async def check_subdomain_availability(subdomain: str, db: Session = Depends(get_db)):
-    if not validate_subdomain(subdomain):
-        return {
-            "available": False,
-            "reason": "Invalid format"
-        }
+def subdomain_availability(db: Session, subdomain: str) -> dict:
+    problem = check_subdomain(subdomain)
+    if problem:
+        # Suggestions are only for names someone else holds
+        return {"available": False, "reason": problem, "suggestions": []}
+    
+    if not name_prefilter.might_exist("subdomain", subdomain.lower()):
+        return {"available": True, "reason": None, "suggestions": []}
     
     existing = db.query(Subdomain).filter(
         Subdomain.subdomain == subdomain.lower()
@@ -118,9 +140,87 @@ async def check_subdomain_availability(subdomain: str, db: Session = Depends(get
     
     return {
         "available": existing is None,
-        "reason": "Already taken" if existing else None
+        "reason": "Already taken" if existing else None,
+        "suggestions": suggest_subdomains(db, subdomain) if existing else []
     }
 
+def username_availability(db: Session, username: str) -> dict:
+    problem = check_username(username)
+    if problem:
+        return {"available": False, "reason": problem}
+    
+    if name_prefilter.might_exist("username", username):
+        existing = db.query(User.id).filter(User.username == username).first()
+        if existing:
+            return {"available": False, "reason": "Already taken"}
+    
+    return {"available": True, "reason": None}
+
+AVAILABILITY_CHECKS = {
+    "subdomain": subdomain_availability,
+    "username": username_availability,
+}
+
+@router.get("/check/{subdomain}")
+async def check_subdomain_availability(subdomain: str, db: Session = Depends(get_read_db)):
+    return subdomain_availability(db, subdomain)
+
+def run_availability_check(kind: str, name: str) -> dict:
+    db = open_read_session()
+    try:
+        return AVAILABILITY_CHECKS[kind](db, name)
+    finally:
+        db.close()
+
+# Live availability for signup forms: one socket per client instead of one
+# request per keystroke. Clients send {"id": ..., "kind": "subdomain" |
+# "username", "name": ...}; only the latest name per kind is answered once
+# typing pauses.
+@router.websocket("/check/ws")
+async def live_availability(websocket: WebSocket):
+    await websocket.accept()
+    pending = {}
+    answers = {}
+    
+    async def answer(request_id, kind: str, name: str):
+        await asyncio.sleep(settings.LIVE_CHECK_DEBOUNCE_MS / 1000)
+        key = (kind, name)
+        # Answers are reused only briefly (backspacing over a name), so a name
+        # someone else takes stops being reported as available
+        now = time.monotonic()
+        cached = answers.get(key)
+        if cached is None or cached[0] <= now:
+            if len(answers) >= 256:
+                answers.clear()
+            result = await run_in_threadpool(run_availability_check, kind, name)
+            cached = answers[key] = (now + settings.LIVE_CHECK_ANSWER_TTL_SECONDS, result)
+        # Don't let a superseding message cancel us halfway through a frame
+        await asyncio.shield(websocket.send_json({"id": request_id, "kind": kind, "name": name, **cached[1]}))
+    
+    try:
+        while True:
+            try:
+                message = orjson.loads(await websocket.receive_text())
+                kind = message.get("kind", "subdomain")
+                name = str(message["name"])[:64]
+            except (orjson.JSONDecodeError, KeyError, AttributeError):
+                await websocket.send_json({"error": "Expected {\"kind\": ..., \"name\": ...}"})
+                continue
+            
+            if not isinstance(kind, str) or kind not in AVAILABILITY_CHECKS:
+                await websocket.send_json({"id": message.get("id"), "error": "Unknown kind"})
+                continue
+            
+            # A newer name supersedes whatever is still waiting or running
+            if kind in pending:
+                pending[kind].cancel()
+            pending[kind] = asyncio.create_task(answer(message.get("id"), kind, name))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in pending.values():
+            task.cancel()
+
 @router.put("/my", response_model=SubdomainResponse)
 async def update_my_subdomain(
     subdomain_data: SubdomainUpdate,
@@ -146,28 +246,43 @@ async def update_my_subdomain(
             )
         
         # Check availability
-        existing = db.query(Subdomain).filter(
-            Subdomain.subdomain == subdomain_data.subdomain.lower()
-        ).first()
+        new_name = subdomain_data.subdomain.lower()
+        if name_prefilter.might_exist("subdomain", new_name):
+            existing = db.query(Subdomain).filter(
+                Subdomain.subdomain == new_name
+            ).first()
+            
+            if existing:
+                raise HTTPException(
+                    status_code=400,
+                    detail=taken_detail(db, new_name, current_user.username)
+                )
         
-        if existing:
+        old_name = subdomain.subdomain
+        subdomain.subdomain = new_name
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
             raise HTTPException(
                 status_code=400,
-                detail="Subdomain already taken"
+                detail=taken_detail(db, new_name, current_user.username)
             )
-        
-        subdomain.subdomain = subdomain_data.subdomain.lower()
+        await name_prefilter.add("subdomain", new_name)
+        await invalidate(SUBDOMAIN_KEY.format(old_name), SUBDOMAIN_KEY.format(new_name))
+        # Custom domains follow the subdomain to its new name
+        hosts = custom_hosts(db, subdomain.id)
+        await host_resolver.set(hosts, new_name)
+        await run_in_threadpool(
+            update_tenant_map,
+            add=[new_name],
+            remove=[old_name],
+            add_hosts={host: new_name for host in hosts}
+        )
     
-    db.commit()
     db.refresh(subdomain)
     
-    return SubdomainResponse(
-        id=subdomain.id,
-        subdomain=subdomain.subdomain,
-        full_url=f"https://{subdomain.subdomain}.myluminarasystem.pro",
-        created_at=subdomain.created_at.isoformat(),
-        owner_username=current_user.username
-    )
+    return json_response(encode(subdomain_payload(subdomain, current_user.username)))
 
 @router.delete("/my")
 async def delete_my_subdomain(
@@ -184,8 +299,13 @@ async def delete_my_subdomain(
             detail="You don't have a subdomain to delete"
         )
     
+    subdomain_name = subdomain.subdomain
+    hosts = custom_hosts(db, subdomain.id)
     db.delete(subdomain)
     db.commit()
+    await invalidate(SUBDOMAIN_KEY.format(subdomain_name))
+    await host_resolver.remove(hosts)
+    await run_in_threadpool(update_tenant_map, remove=[subdomain_name], remove_hosts=hosts)
     
     return {"message": "Subdomain deleted successfully"}
 
@@ -271,23 +391,202 @@ async def delete_admin_token(
     
     return {"message": "Admin token deleted successfully"}
 
-# Get subdomain info by subdomain name (public endpoint)
-@router.get("/{subdomain_name}", response_model=SubdomainResponse)
-async def get_subdomain_info(subdomain_name: str, db: Session = Depends(get_db)):
+@router.get("/my/traffic")
+async def get_my_traffic(
+    days: int = Query(30, ge=1, le=365),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     subdomain = db.query(Subdomain).filter(
-        Subdomain.subdomain == subdomain_name.lower()
+        Subdomain.user_id == current_user.id
     ).first()
     
     if not subdomain:
         raise HTTPException(
             status_code=404,
-            detail="Subdomain not found"
+            detail="You don't have a subdomain yet"
         )
     
-    return SubdomainResponse(
-        id=subdomain.id,
-        subdomain=subdomain.subdomain,
-        full_url=f"https://{subdomain.subdomain}.myluminarasystem.pro",
-        created_at=subdomain.created_at.isoformat(),
-        owner_username=subdomain.owner.username
+    # Rollups lag live traffic by up to one flush interval
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    rows = db.query(TenantTraffic).filter(
+        TenantTraffic.subdomain_id == subdomain.id,
+        TenantTraffic.day >= since
+    ).order_by(TenantTraffic.day).all()
+    
+    return {
+        "subdomain": subdomain.subdomain,
+        "days": [
+            {"day": row.day, "requests": row.requests, "unique_visitors": row.unique_visitors}
+            for row in rows
+        ],
+        "total_requests": sum(row.requests for row in rows)
+    }
+
+# Custom domains: the tenant adds the domain (pending), publishes the DNS TXT
+# challenge, and calls /verify. Once verified, requests for the domain are
+# served as the tenant's subdomain and it becomes an allowed CORS origin.
+@router.get("/my/domains", response_model=List[CustomDomainResponse])
+async def list_my_domains(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    subdomain = db.query(Subdomain).filter(
+        Subdomain.user_id == current_user.id
+    ).first()
+    
+    if not subdomain:
+        raise HTTPException(
+            status_code=404,
+            detail="You don't have a subdomain yet"
+        )
+    
+    domains = db.query(CustomDomain).filter(
+        CustomDomain.subdomain_id == subdomain.id
+    ).order_by(CustomDomain.created_at).all()
+    
+    return json_response(orjson.dumps([
+        custom_domain_payload(domain, subdomain.subdomain) for domain in domains
+    ]))
+
+@router.post("/my/domains", response_model=CustomDomainResponse)
+async def add_my_domain(
+    domain_data: CustomDomainCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    subdomain = db.query(Subdomain).filter(
+        Subdomain.user_id == current_user.id
+    ).first()
+    
+    if not subdomain:
+        raise HTTPException(
+            status_code=400,
+            detail="You need a subdomain before adding a custom domain"
+        )
+    
+    domain = normalize_host(domain_data.domain.strip())
+    if not validate_custom_domain(domain):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid domain. Use a hostname such as www.example.com outside {settings.ROOT_DOMAIN}."
+        )
+    
+    count = db.query(CustomDomain).filter(
+        CustomDomain.subdomain_id == subdomain.id
+    ).count()
+    
+    if count >= settings.MAX_CUSTOM_DOMAINS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"You can attach at most {settings.MAX_CUSTOM_DOMAINS} custom domains"
+        )
+    
+    custom_domain = CustomDomain(
+        subdomain_id=subdomain.id,
+        domain=domain,
+        verification_token=new_token()
     )
+    db.add(custom_domain)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="You have already added this domain"
+        )
+    db.refresh(custom_domain)
+    
+    return json_response(encode(custom_domain_payload(custom_domain, subdomain.subdomain)))
+
+@router.post("/my/domains/{domain}/verify", response_model=CustomDomainResponse)
+async def verify_my_domain(
+    domain: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    custom_domain = db.query(CustomDomain).join(Subdomain).filter(
+        Subdomain.user_id == current_user.id,
+        CustomDomain.domain == normalize_host(domain)
+    ).first()
+    
+    if not custom_domain:
+        raise HTTPException(
+            status_code=404,
+            detail="Custom domain not found"
+        )
+    
+    subdomain_name = custom_domain.subdomain.subdomain
+    if custom_domain.verified_at is None:
+        if not await has_challenge(custom_domain.domain, custom_domain.verification_token):
+            raise HTTPException(
+                status_code=400,
+                detail=f"TXT record {challenge_name(custom_domain.domain)} not found or doesn't match yet"
+            )
+        
+        custom_domain.verified_at = func.now()
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail="Domain is already verified for another subdomain"
+            )
+        db.refresh(custom_domain)
+        await host_resolver.set([custom_domain.domain], subdomain_name)
+        await run_in_threadpool(update_tenant_map, add_hosts={custom_domain.domain: subdomain_name})
+    
+    return json_response(encode(custom_domain_payload(custom_domain, subdomain_name)))
+
+@router.delete("/my/domains/{domain}")
+async def remove_my_domain(
+    domain: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    custom_domain = db.query(CustomDomain).join(Subdomain).filter(
+        Subdomain.user_id == current_user.id,
+        CustomDomain.domain == normalize_host(domain)
+    ).first()
+    
+    if not custom_domain:
+        raise HTTPException(
+            status_code=404,
+            detail="Custom domain not found"
+        )
+    
+    host = custom_domain.domain
+    was_verified = custom_domain.verified_at is not None
+    db.delete(custom_domain)
+    db.commit()
+    # A pending claim was never routed, and the host may belong to someone else
+    if was_verified:
+        await host_resolver.remove([host])
+        await run_in_threadpool(update_tenant_map, remove_hosts=[host])
+    
+    return {"message": "Custom domain removed successfully"}
+
+# Get subdomain info by subdomain name (public endpoint)
+@router.get("/{subdomain_name}", response_model=SubdomainResponse)
+async def get_subdomain_info(subdomain_name: str, request: Request, db: Session = Depends(get_read_db)):
+    async def load():
+        subdomain = db.query(Subdomain).filter(
+            Subdomain.subdomain == subdomain_name.lower()
+        ).first()
+        
+        if not subdomain or subdomain.owner.deleted_at is not None:
+            return None
+        return encode(subdomain_payload(subdomain, subdomain.owner.username))
+    
+    # Concurrent misses for the same tenant share a single query
+    body = await get_or_load(SUBDOMAIN_KEY.format(subdomain_name.lower()), load)
+    
+    if body is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Subdomain not found"
+        )
+    
+    return conditional_response(request, body)
@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
 from typing import Optional
 
-from ..database import get_db
-from ..models.user import User
+from ..cache import PROFILE_KEY, SUBDOMAIN_KEY, get_or_load, invalidate
+from ..database import get_db, get_read_db
+from ..http_cache import conditional_response
+from ..host_resolver import host_resolver
+from ..models.user import User, Subdomain, CustomDomain
+from ..prefilter import name_prefilter
+from ..purge import purge_user
 from ..schemas.auth import UserResponse
 from ..auth.jwt import verify_token
+from ..serializers import user_payload, encode, json_response
+from ..tenant_map import update_tenant_map
 
 router = APIRouter()
 security = HTTPBearer()
@@ -24,7 +33,10 @@ async def get_current_user(
             detail="Invalid authentication credentials"
         )
     
-    user = db.query(User).filter(User.username == username).first()
+    user = db.query(User).filter(
+        User.username == username,
+        User.deleted_at.is_(None)
+    ).first()
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -35,30 +47,23 @@ async def get_current_user(
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
-    return UserResponse(
-        id=current_user.id,
-        email=current_user.email,
-        username=current_user.username,
-        provider=current_user.provider,
-        is_verified=current_user.is_verified,
-        created_at=current_user.created_at.isoformat()
-    )
+    return json_response(encode(user_payload(current_user)))
 
 @router.get("/profile/{username}", response_model=UserResponse)
-async def get_user_profile(username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
+async def get_user_profile(username: str, request: Request, db: Session = Depends(get_read_db)):
+    async def load():
+        user = db.query(User).filter(
+            User.username == username,
+            User.deleted_at.is_(None)
+        ).first()
+        return encode(user_payload(user)) if user else None
+    
+    body = await get_or_load(PROFILE_KEY.format(username), load)
     
-    if not user:
+    if body is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return UserResponse(
-        id=user.id,
-        email=user.email,
-        username=user.username,
-        provider=user.provider,
-        is_verified=user.is_verified,
-        created_at=user.created_at.isoformat()
-    )
+    return conditional_response(request, body)
 
 @router.put("/me", response_model=UserResponse)
 async def update_current_user(
@@ -83,23 +88,41 @@ async def update_current_user(
     
     db.commit()
     db.refresh(current_user)
+    if email:
+        await name_prefilter.add("email", current_user.email)
+    await invalidate(PROFILE_KEY.format(current_user.username))
     
-    return UserResponse(
-        id=current_user.id,
-        email=current_user.email,
-        username=current_user.username,
-        provider=current_user.provider,
-        is_verified=current_user.is_verified,
-        created_at=current_user.created_at.isoformat()
-    )
+    return json_response(encode(user_payload(current_user)))
 
 @router.delete("/me")
 async def delete_current_user(
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Delete user and all related data (cascade should handle this)
-    db.delete(current_user)
+    subdomain_names = [
+        name for (name,) in db.query(Subdomain.subdomain).filter(
+            Subdomain.user_id == current_user.id
+        )
+    ]
+    hosts = [
+        domain for (domain,) in db.query(CustomDomain.domain).join(Subdomain).filter(
+            Subdomain.user_id == current_user.id,
+            CustomDomain.verified_at.isnot(None)
+        )
+    ]
+    cache_keys = [PROFILE_KEY.format(current_user.username)]
+    cache_keys += [SUBDOMAIN_KEY.format(name) for name in subdomain_names]
+    
+    # Soft delete now; the rows (and their children, via ON DELETE CASCADE)
+    # are purged after the response is sent
+    user_id = current_user.id
+    current_user.is_active = False
+    current_user.deleted_at = func.now()
     db.commit()
+    await invalidate(*cache_keys)
+    await host_resolver.remove(hosts)
+    await run_in_threadpool(update_tenant_map, remove=subdomain_names, remove_hosts=hosts)
+    background_tasks.add_task(purge_user, user_id)
     
     return {"message": "Account deleted successfully"}
@@ -17,6 +17,25 @@ class SubdomainResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class CustomDomainCreate(BaseModel):
+    domain: str
+
+class DomainVerification(BaseModel):
+    type: str
+    name: str
+    value: str
+
+class CustomDomainResponse(BaseModel):
+    id: int
+    domain: str
+    subdomain: str
+    verified: bool
+    verification: Optional[DomainVerification] = None
+    created_at: str
+    
+    class Config:
+        from_attributes = True
+
 class AdminTokenResponse(BaseModel):
     token: str
     created_at: str
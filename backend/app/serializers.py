@@ -0,0 +1,51 @@
+import orjson
+from typing import Optional
+from fastapi.responses import Response
+
+from .models.user import User, Subdomain, CustomDomain
+from .domain_verification import challenge_name, challenge_value
+from .tenant_map import tenant_host
+
+JSON_MEDIA_TYPE = "application/json"
+
+def subdomain_payload(subdomain: Subdomain, owner_username: str) -> dict:
+    # created_at stays a datetime; orjson encodes it natively as ISO 8601
+    return {
+        "id": subdomain.id,
+        "subdomain": subdomain.subdomain,
+        "full_url": f"https://{tenant_host(subdomain.subdomain)}",
+        "created_at": subdomain.created_at,
+        "owner_username": owner_username,
+    }
+
+def custom_domain_payload(custom_domain: CustomDomain, subdomain_name: str) -> dict:
+    return {
+        "id": custom_domain.id,
+        "domain": custom_domain.domain,
+        "subdomain": subdomain_name,
+        "verified": custom_domain.verified_at is not None,
+        # The record to publish before calling .../verify; omitted once verified
+        "verification": None if custom_domain.verified_at is not None else {
+            "type": "TXT",
+            "name": challenge_name(custom_domain.domain),
+            "value": challenge_value(custom_domain.verification_token),
+        },
+        "created_at": custom_domain.created_at,
+    }
+
+def user_payload(user: User) -> dict:
+    return {
+        "id": user.id,
+        "email": user.email,
+        "username": user.username,
+        "provider": user.provider,
+        "is_verified": user.is_verified,
+        "created_at": user.created_at,
+    }
+
+def encode(payload: dict) -> bytes:
+    return orjson.dumps(payload)
+
+def json_response(body: bytes, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    # Body is already encoded, so skip response_model validation and re-encoding
+    return Response(content=body, status_code=status_code, headers=headers, media_type=JSON_MEDIA_TYPE)
@@ -0,0 +1,21 @@
+from uvicorn.workers import UvicornWorker
+
+from .cache import reset_redis_after_fork
+from .database import dispose_engines_after_fork
+from .logging_config import setup_logging
+
+class ProductionWorker(UvicornWorker):
+    # uvloop and httptools are pinned rather than auto-detected, and uvicorn's
+    # access log is off since the app writes its own sampled one
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        "lifespan": "on",
+        "access_log": False,
+        "proxy_headers": True,
+    }
+
+def reinitialize_after_fork():
+    dispose_engines_after_fork()
+    reset_redis_after_fork()
+    setup_logging()
@@ -0,0 +1,68 @@
+import asyncio
+import secrets
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+from redis.exceptions import RedisError
+
+# Releases the lock only if we still own it
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class SingleFlight:
+    # Collapses concurrent calls for the same key within this worker: the
+    # first caller starts the load, later callers await the same task.
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shield so one caller disconnecting doesn't cancel the shared load
+        return await asyncio.shield(task)
+
+class RedisLock:
+    # Cross-worker counterpart: a short-lived SET NX lock per key
+
+    def __init__(self, client, key: str, ttl_ms: int):
+        self.client = client
+        self.key = f"lock:{key}"
+        self.ttl_ms = ttl_ms
+        self.token = secrets.token_hex(8)
+
+    async def acquire(self) -> bool:
+        try:
+            return bool(await self.client.set(self.key, self.token, nx=True, px=self.ttl_ms))
+        except RedisError:
+            # Without Redis every worker loads for itself
+            return True
+
+    async def locked(self) -> bool:
+        # Whether anyone (including us) still holds the lock
+        try:
+            return bool(await self.client.exists(self.key))
+        except RedisError:
+            return False
+
+    async def release(self):
+        try:
+            await self.client.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+        except RedisError:
+            pass
+
+async def wait_for(probe: Callable[[], Awaitable[Optional[object]]], timeout: float, interval: float = 0.05):
+    # Polls until another worker has produced the value or the timeout passes
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        value = await probe()
+        if value is not None:
+            return value
+        await asyncio.sleep(interval)
+    return None
@@ -0,0 +1,84 @@
+import re
+import unicodedata
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models.user import Subdomain
+from .name_policy import validate_subdomain
+from .prefilter import name_prefilter
+
+MAX_LENGTH = 30
+
+# Letters NFKD can't decompose into ASCII, plus separators we map to dashes
+TRANSLITERATIONS = str.maketrans({
+    "ß": "ss", "æ": "ae", "œ": "oe", "ø": "o", "ð": "d", "þ": "th",
+    "ł": "l", "đ": "d", "ı": "i", "_": "-", ".": "-", " ": "-",
+})
+SUFFIXES = ("site", "hq", "online", "web", "home", "page", "world", "hub")
+PREFIXES = ("my", "the", "its")
+
+NON_SLUG_RE = re.compile(r"[^a-z0-9-]+")
+DASHES_RE = re.compile(r"-{2,}")
+
+def transliterate(name: str) -> str:
+    name = name.lower().translate(TRANSLITERATIONS)
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    name = NON_SLUG_RE.sub("", name)
+    return DASHES_RE.sub("-", name).strip("-")
+
+def _fit(stem: str, extra: str, sep: str = "-") -> Optional[str]:
+    # Trim the stem so stem + extra still fits in a subdomain label; None
+    # when extra leaves no room for any of the stem
+    room = max(MAX_LENGTH - len(extra) - len(sep), 0)
+    stem = stem[:room].rstrip("-")
+    if not stem:
+        return None
+    return f"{stem}{sep}{extra}"
+
+def generate_candidates(name: str, username: Optional[str] = None) -> List[str]:
+    base = transliterate(name) or "site"
+    compact = base.replace("-", "")
+    candidates = [base, compact]
+    
+    candidates += [_fit(base, suffix) for suffix in SUFFIXES]
+    candidates += [f"{prefix}-{base[:MAX_LENGTH - len(prefix) - 1].rstrip('-')}" for prefix in PREFIXES]
+    candidates += [_fit(compact, suffix, "") for suffix in SUFFIXES[:3]]
+    
+    if username:
+        user = transliterate(username)
+        if user:
+            candidates += [user, _fit(base, user), _fit(user, base)]
+    
+    year = str(datetime.utcnow().year)
+    candidates += [_fit(base, str(n)) for n in range(2, 10)]
+    candidates += [_fit(compact, str(n), "") for n in range(1, 10)]
+    candidates += [_fit(base, year), _fit(compact, year, "")]
+    
+    # Keep generation order as the ranking, dropping duplicates and misfits
+    return [c for c in dict.fromkeys(candidates) if c is not None]
+
+def suggest_subdomains(
+    db: Session,
+    name: str,
+    username: Optional[str] = None,
+    limit: int = settings.SUBDOMAIN_SUGGESTION_LIMIT
+) -> List[str]:
+    taken_name = name.lower()
+    candidates = [
+        c for c in generate_candidates(name, username)
+        if c != taken_name and validate_subdomain(c)
+    ]
+    
+    # Prefilter misses are definitely free; confirm the rest in one query
+    maybe_taken = [c for c in candidates if name_prefilter.might_exist("subdomain", c)]
+    taken = set()
+    if maybe_taken:
+        taken = {
+            row.subdomain for row in db.query(Subdomain.subdomain).filter(
+                Subdomain.subdomain.in_(maybe_taken)
+            )
+        }
+    
+    return [c for c in candidates if c not in taken][:limit]
@@ -0,0 +1,137 @@
+import fcntl
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+from typing import Dict, Iterable, Optional
+import orjson
+
+from .config import settings
+
+# Routing map for the reverse proxy, so unknown tenants get a 404 at the edge
+# and never reach the app. With TENANT_MAP_FORMAT=nginx the file is meant to
+# be included at http level:
+#
+#     include /etc/nginx/tenants.map;
+#     server {
+#         server_name *.myluminarasystem.pro;  # plus tenants' custom domains
+#         if ($tenant = "") { return 404; }
+#         location / { proxy_set_header X-Tenant $tenant; proxy_pass http://backend; }
+#     }
+
+NGINX_ENTRY_RE = re.compile(r"^\s*(\S+)\s+(\S+);\s*$")
+
+def tenant_host(subdomain: str) -> str:
+    return f"{subdomain}.{settings.ROOT_DOMAIN}"
+
+def _render(hosts: Dict[str, str]) -> bytes:
+    if settings.TENANT_MAP_FORMAT == "json":
+        return orjson.dumps({"hosts": hosts}, option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2)
+    
+    lines = ["# Generated by app.tenant_map - do not edit", "map $host $tenant {", "    hostnames;", '    default "";']
+    lines += [f"    {host} {tenant};" for host, tenant in sorted(hosts.items())]
+    lines.append("}")
+    return ("\n".join(lines) + "\n").encode()
+
+def _parse(data: bytes) -> Dict[str, str]:
+    if settings.TENANT_MAP_FORMAT == "json":
+        return orjson.loads(data)["hosts"] if data else {}
+    
+    hosts = {}
+    for line in data.decode().splitlines():
+        match = NGINX_ENTRY_RE.match(line)
+        if match and match.group(1) not in ("hostnames", "default"):
+            hosts[match.group(1)] = match.group(2)
+    return hosts
+
+def _write_atomic(hosts: Dict[str, str]):
+    # Write a sibling temp file and rename over the map, so the proxy never
+    # reads a half-written file
+    directory = os.path.dirname(os.path.abspath(settings.TENANT_MAP_PATH))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tenants-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_render(hosts))
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, settings.TENANT_MAP_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    
+    if settings.TENANT_MAP_RELOAD_COMMAND:
+        subprocess.run(shlex.split(settings.TENANT_MAP_RELOAD_COMMAND), check=False)
+
+class _MapLock:
+    # Serializes read-modify-write cycles across workers
+    def __enter__(self):
+        self.file = open(f"{settings.TENANT_MAP_PATH}.lock", "w")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+def update_tenant_map(
+    add: Iterable[str] = (),
+    remove: Iterable[str] = (),
+    add_hosts: Optional[Dict[str, str]] = None,
+    remove_hosts: Iterable[str] = ()
+):
+    # add/remove take subdomain names; add_hosts/remove_hosts take custom
+    # domains (host -> subdomain)
+    if not settings.TENANT_MAP_PATH:
+        return
+    
+    with _MapLock():
+        try:
+            with open(settings.TENANT_MAP_PATH, "rb") as f:
+                hosts = _parse(f.read())
+        except FileNotFoundError:
+            hosts = {}
+        
+        for subdomain in remove:
+            hosts.pop(tenant_host(subdomain), None)
+        for subdomain in add:
+            hosts[tenant_host(subdomain)] = subdomain
+        for host in remove_hosts:
+            hosts.pop(host, None)
+        hosts.update(add_hosts or {})
+        
+        _write_atomic(hosts)
+
+def rebuild_tenant_map():
+    from .database import SessionLocal
+    from .models.user import User, Subdomain, CustomDomain
+    
+    db = SessionLocal()
+    try:
+        rows = db.query(Subdomain.subdomain).join(User).filter(
+            User.deleted_at.is_(None)
+        ).yield_per(5000)
+        hosts = {tenant_host(name): name for (name,) in rows}
+        
+        rows = db.query(CustomDomain.domain, Subdomain.subdomain).join(
+            Subdomain, CustomDomain.subdomain_id == Subdomain.id
+        ).join(User).filter(
+            CustomDomain.verified_at.isnot(None),
+            User.deleted_at.is_(None)
+        ).yield_per(5000)
+        hosts.update({domain: name for domain, name in rows})
+    finally:
+        db.close()
+    
+    with _MapLock():
+        _write_atomic(hosts)
+    return len(hosts)
+
+if __name__ == "__main__":
+    # python -m app.tenant_map rebuild
+    if sys.argv[1:] != ["rebuild"] or not settings.TENANT_MAP_PATH:
+        print("usage: TENANT_MAP_PATH=... python -m app.tenant_map rebuild")
+        sys.exit(1)
+    print(f"Wrote {rebuild_tenant_map()} tenants to {settings.TENANT_MAP_PATH}")
@@ -0,0 +1,222 @@
+import atexit
+import functools
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import httpx
+import orjson
+from sqlalchemy import event
+
+from .config import settings
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[dict] = None):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        tracer.export(self)
+
+class _UnsampledSpan:
+    # Stands in for spans of unsampled traces so children skip recording too
+    def set_attribute(self, key: str, value):
+        pass
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+UNSAMPLED = _UnsampledSpan()
+
+current_span: ContextVar = ContextVar("current_span", default=None)
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(spans) -> dict:
+    # OTLP/HTTP JSON, as accepted by the collector's /v1/traces endpoint
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": settings.TRACE_SERVICE_NAME}}
+        ]},
+        "scopeSpans": [{
+            "scope": {"name": "luminara"},
+            "spans": [{
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            } for span in spans],
+        }],
+    }]}
+
+class Tracer:
+    def __init__(self):
+        self.enabled = settings.TRACE_EXPORTER != "none"
+        self._queue = queue.Queue(maxsize=settings.TRACE_QUEUE_SIZE)
+        self._thread = None
+        self._pid = None
+
+    def start_span(self, name: str, attributes: Optional[dict] = None):
+        parent = current_span.get()
+        if parent is UNSAMPLED or not self.enabled:
+            return UNSAMPLED
+        # Head sampling: the decision is made once, at the root of the trace
+        if parent is None and random.random() >= settings.TRACE_SAMPLE_RATE:
+            return UNSAMPLED
+        return Span(name, parent, attributes)
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[dict] = None):
+        span = self.start_span(name, attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(e)
+            raise
+        else:
+            span.end()
+        finally:
+            current_span.reset(token)
+
+    def export(self, span: Span):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Dropping spans is better than slowing down requests
+            pass
+
+    def _ensure_worker(self):
+        # (Re)start the exporter in each process, e.g. after a fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _drain(self):
+        batch = []
+        while len(batch) < settings.TRACE_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            time.sleep(settings.TRACE_EXPORT_INTERVAL_SECONDS)
+            self.flush()
+
+    def flush(self):
+        batch = self._drain()
+        while batch:
+            try:
+                self._write(batch)
+            except Exception:
+                pass
+            batch = self._drain()
+
+    def _write(self, spans):
+        if settings.TRACE_EXPORTER == "file":
+            with open(settings.TRACE_FILE_PATH, "ab") as f:
+                for span in spans:
+                    f.write(orjson.dumps({
+                        "trace_id": span.trace_id,
+                        "span_id": span.span_id,
+                        "parent_id": span.parent_id,
+                        "name": span.name,
+                        "start_ns": span.start_ns,
+                        "duration_ms": (span.end_ns - span.start_ns) / 1e6,
+                        "attributes": span.attributes,
+                        "error": span.error,
+                    }, default=str) + b"\n")
+        elif settings.TRACE_EXPORTER == "otlp":
+            httpx.post(settings.TRACE_COLLECTOR_URL, json=to_otlp(spans), timeout=5)
+
+tracer = Tracer()
+
+def traced(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    # Pass as transport= to outbound httpx.AsyncClient instances. The span is
+    # ended however the call ends, so connect errors and timeouts, which
+    # never produce a response, are traced too.
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        span = tracer.start_span(
+            f"HTTP {request.method}",
+            {"http.method": request.method, "http.url": str(request.url.copy_with(query=None))}
+        )
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            span.end(e)
+            raise
+        span.set_attribute("http.status_code", response.status_code)
+        span.end()
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+def instrument_engine(engine):
+    # One span per statement, parented to whatever route span is active
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._trace_span = tracer.start_span("db.query", {"db.statement": statement[:500]})
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        span = getattr(exception_context.execution_context, "_trace_span", None)
+        if span is not None:
+            span.end(exception_context.original_exception)
@@ -0,0 +1,133 @@
+import asyncio
+import collections
+import hashlib
+import logging
+from datetime import datetime, timezone
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from redis.exceptions import RedisError
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from .cache import redis_client
+from .config import settings
+from .database import SessionLocal
+from .models.user import Subdomain, TenantTraffic
+from .prefilter import name_prefilter
+
+logger = logging.getLogger(__name__)
+
+UNIQUES_KEY = "traffic:uv:{}:{}"
+# Keep HyperLogLogs long enough to recount a day that flushed late
+UNIQUES_TTL_SECONDS = 3 * 86400
+
+def visitor_id(request: Request) -> str:
+    forwarded = request.headers.get("x-forwarded-for")
+    ip = forwarded.split(",")[0].strip() if forwarded else (request.client.host if request.client else "")
+    raw = f"{ip}|{request.headers.get('user-agent', '')}"
+    return hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()
+
+class TrafficCounter:
+    # Per-worker aggregation: requests are counted in memory and written out
+    # in one batch per interval, so tenant requests never write to the DB
+
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.visitors = collections.defaultdict(set)
+        self.dropped = 0
+
+    def record(self, subdomain: str, request: Request):
+        # Any label under the root domain resolves, so a scan of random hosts
+        # must not grow the counters: skip names that are definitely not
+        # tenants, and cap how many tenants one interval can track
+        if not name_prefilter.might_exist("subdomain", subdomain):
+            return
+        key = (subdomain, datetime.now(timezone.utc).date())
+        if key not in self.requests and len(self.requests) >= settings.TRAFFIC_MAX_TENANTS_PER_FLUSH:
+            self.dropped += 1
+            return
+        self.requests[key] += 1
+        visitors = self.visitors[key]
+        if len(visitors) < settings.TRAFFIC_MAX_VISITORS_PER_FLUSH:
+            visitors.add(visitor_id(request))
+
+    async def flush(self):
+        if self.dropped:
+            logger.warning("Dropped %d requests over the per-interval tenant cap", self.dropped)
+            self.dropped = 0
+        if not self.requests:
+            return
+        requests, self.requests = self.requests, collections.Counter()
+        visitors, self.visitors = self.visitors, collections.defaultdict(set)
+        
+        # Prefilter false positives are dropped here, before they reach Redis
+        subdomain_ids = await run_in_threadpool(self._subdomain_ids, {subdomain for subdomain, _ in requests})
+        requests = collections.Counter({key: n for key, n in requests.items() if key[0] in subdomain_ids})
+        visitors = {key: ids for key, ids in visitors.items() if key[0] in subdomain_ids and ids}
+        if not requests:
+            return
+        
+        uniques = {}
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for (subdomain, day), ids in visitors.items():
+                    key = UNIQUES_KEY.format(subdomain, day.isoformat())
+                    pipe.pfadd(key, *ids)
+                    pipe.expire(key, UNIQUES_TTL_SECONDS)
+                    pipe.pfcount(key)
+                results = await pipe.execute()
+            for index, key in enumerate(visitors):
+                uniques[key] = results[index * 3 + 2]
+        except RedisError:
+            logger.warning("Could not update unique visitor counts", exc_info=True)
+        
+        await run_in_threadpool(self._write, requests, uniques, subdomain_ids)
+
+    def _subdomain_ids(self, names):
+        db = SessionLocal()
+        try:
+            return dict(db.query(Subdomain.subdomain, Subdomain.id).filter(Subdomain.subdomain.in_(names)))
+        finally:
+            db.close()
+
+    def _write(self, requests, uniques, ids):
+        db = SessionLocal()
+        try:
+            rows = [
+                {
+                    "subdomain_id": ids[subdomain],
+                    "day": day,
+                    "requests": count,
+                    "unique_visitors": uniques.get((subdomain, day), 0),
+                }
+                for (subdomain, day), count in requests.items()
+                if subdomain in ids  # Renamed or deleted since the lookup
+            ]
+            if not rows:
+                return
+            
+            stmt = insert(TenantTraffic).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                constraint="uq_tenant_traffic_subdomain_day",
+                set_={
+                    "requests": TenantTraffic.requests + stmt.excluded.requests,
+                    # PFCOUNT already covers every worker and only grows within a
+                    # day, so keep the larger estimate; a flush that couldn't
+                    # reach Redis sends 0 and must not wipe the stored count
+                    "unique_visitors": func.greatest(TenantTraffic.unique_visitors, stmt.excluded.unique_visitors),
+                }
+            )
+            db.execute(stmt)
+            db.commit()
+        finally:
+            db.close()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.TRAFFIC_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush tenant traffic counters")
+
+traffic_counter = TrafficCounter()
@@ -0,0 +1,114 @@
+# Compares server connection counts and query latency for the default engine
+# configuration against DATABASE_POOLER=pgbouncer, at a given worker count.
+#
+#     python -m benchmarks.pooler_bench --url postgresql://...@pgbouncer:6432/db \
+#         --admin-url postgresql://...@db:5432/db --workers 32 --mode pgbouncer
+#
+# --url is what the workers connect to (PgBouncer, or Postgres directly);
+# --admin-url must reach Postgres itself so pg_stat_activity shows the real
+# number of server connections. Run from backend/ with the app's env loaded.
+import argparse
+import multiprocessing
+import statistics
+import threading
+import time
+from sqlalchemy import create_engine, text
+
+from app.database import engine_options
+
+QUERY = text("SELECT id, subdomain FROM subdomains ORDER BY id LIMIT 10")
+
+def worker(url: str, mode: str, pool_size: int, threads: int, duration: float, results):
+    engine = create_engine(url, **engine_options(url, pooler=mode, local_pool_size=pool_size))
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+    
+    def loop():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(QUERY).fetchall()
+            except Exception:
+                with lock:
+                    errors += 1
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+    
+    pool = [threading.Thread(target=loop) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    engine.dispose()
+    results.put((latencies, errors))
+
+def sample_connections(admin_url: str, stop: threading.Event, samples: list):
+    admin = create_engine(admin_url)
+    with admin.connect() as conn:
+        while not stop.is_set():
+            count = conn.execute(text(
+                "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+            )).scalar()
+            samples.append(count)
+            conn.commit()
+            time.sleep(0.2)
+    admin.dispose()
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark engine settings behind a connection pooler")
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--admin-url", required=True)
+    parser.add_argument("--mode", choices=["none", "pgbouncer"], default="pgbouncer")
+    parser.add_argument("--pool-size", type=int, default=0, help="local pool size in pgbouncer mode (0 = NullPool)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent requests per worker")
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+    
+    results = multiprocessing.Queue()
+    stop = threading.Event()
+    connections = []
+    sampler = threading.Thread(target=sample_connections, args=(args.admin_url, stop, connections))
+    sampler.start()
+    
+    procs = [
+        multiprocessing.Process(
+            target=worker,
+            args=(args.url, args.mode, args.pool_size, args.threads, args.duration, results)
+        )
+        for _ in range(args.workers)
+    ]
+    for p in procs:
+        p.start()
+    
+    latencies, errors = [], 0
+    for _ in procs:
+        worker_latencies, worker_errors = results.get()
+        latencies += worker_latencies
+        errors += worker_errors
+    for p in procs:
+        p.join()
+    stop.set()
+    sampler.join()
+    
+    print(f"mode={args.mode} workers={args.workers} threads={args.threads} pool_size={args.pool_size}")
+    print(f"queries={len(latencies)} errors={errors} qps={len(latencies) / args.duration:.0f}")
+    if latencies:
+        print(
+            f"latency ms p50={percentile(latencies, 50):.2f} p95={percentile(latencies, 95):.2f} "
+            f"p99={percentile(latencies, 99):.2f} mean={statistics.mean(latencies):.2f}"
+        )
+    if connections:
+        print(f"server connections max={max(connections)} mean={statistics.mean(connections):.1f}")
+
+if __name__ == "__main__":
+    main()
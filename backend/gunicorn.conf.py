@@ -0,0 +1,35 @@
+# Production server profile: gunicorn as process manager, uvicorn workers.
+#
+#     gunicorn app.main:app -c gunicorn.conf.py
+#
+# Every setting can be overridden from the environment.
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# Async workers are CPU-bound once I/O is overlapped, so one per core
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "app.server.ProductionWorker"
+
+# Import the app once in the master so workers fork with it already loaded;
+# post_fork below resets what must not be shared across processes
+preload_app = os.environ.get("PRELOAD_APP", "true").lower() == "true"
+
+# Recycle workers to cap slow memory growth; jitter avoids restarting all at once
+max_requests = int(os.environ.get("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", 1000))
+
+# On SIGTERM workers stop accepting and get this long to drain in-flight
+# requests. Keep it below the container's stop timeout.
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 25))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+
+accesslog = None
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info").lower()
+
+def post_fork(server, worker):
+    from app.server import reinitialize_after_fork
+    reinitialize_after_fork()
@@ -0,0 +1,48 @@
+import os
+
+# Settings without defaults must exist before anything imports app.config
+for name in (
+    "SECRET_KEY", "GITHUB_CLIENT_ID", "GITHUB_CLIENT_SECRET", "DISCORD_CLIENT_ID",
+    "DISCORD_CLIENT_SECRET", "SMTP_USERNAME", "SMTP_PASSWORD", "FROM_EMAIL",
+):
+    os.environ.setdefault(name, "test")
+# Keep the per-worker filters small; the defaults size them for production
+os.environ.setdefault("PREFILTER_CAPACITY", "10000")
+
+import fakeredis
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import user  # noqa: F401 - registers the tables
+
+# Modules bind redis_client at import, so it is swapped in each of them
+REDIS_MODULES = (
+    "app.cache", "app.database", "app.host_resolver", "app.idempotency",
+    "app.prefilter", "app.traffic", "app.auth.oauth_state",
+)
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis()
+    for module in REDIS_MODULES:
+        monkeypatch.setattr(f"{module}.redis_client", client)
+    return client
+
+@pytest.fixture
+def db_sessionmaker():
+    # In-memory SQLite stands in for Postgres; it only enforces foreign keys
+    # (and so ON DELETE CASCADE) when asked to
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(connection, record):
+        connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
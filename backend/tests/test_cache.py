@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+from app import cache
+from app.singleflight import RedisLock, SingleFlight
+
+def test_singleflight_collapses_concurrent_calls():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(flight.do("key", load) for _ in range(10)))
+        # Once the load finishes the key is free again
+        again = await flight.do("key", load)
+        return calls, results, again
+
+    calls, results, again = asyncio.run(run())
+    assert results == [1] * 10
+    assert again == 2 and calls == 2
+
+def test_get_or_load_loads_once_for_concurrent_misses(fake_redis):
+    async def run():
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return b"value"
+
+        results = await asyncio.gather(*(cache.get_or_load("cache:test", loader) for _ in range(10)))
+        cached = await cache.get_or_load("cache:test", loader)
+        return calls, results, cached
+
+    calls, results, cached = asyncio.run(run())
+    assert calls == 1
+    assert results == [b"value"] * 10
+    assert cached == b"value"
+
+def test_misses_are_cached_briefly(fake_redis):
+    async def run():
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            return None
+
+        first = await cache.get_or_load("cache:missing", loader)
+        second = await cache.get_or_load("cache:missing", loader)
+        return calls, first, second, await fake_redis.ttl("cache:missing")
+
+    calls, first, second, ttl = asyncio.run(run())
+    assert first is None and second is None
+    assert calls == 1
+    assert 0 < ttl <= cache.settings.CACHE_NEGATIVE_TTL_SECONDS
+
+def test_waiter_returns_the_other_workers_value(fake_redis):
+    async def run():
+        # Another worker holds the lock and fills the entry shortly after
+        other = RedisLock(fake_redis, "cache:shared", 2000)
+        assert await other.acquire()
+
+        async def other_worker():
+            await asyncio.sleep(0.1)
+            await cache._set_entry("cache:shared", b"theirs", 5, 60)
+            await other.release()
+
+        async def loader():
+            return b"ours"
+
+        filler = asyncio.ensure_future(other_worker())
+        value = await cache.get_or_load("cache:shared", loader)
+        await filler
+        return value
+
+    assert asyncio.run(run()) == b"theirs"
+
+def test_waiter_stops_once_the_lock_is_released(fake_redis):
+    async def run():
+        # The other worker gives up without writing anything
+        other = RedisLock(fake_redis, "cache:abandoned", 2000)
+        assert await other.acquire()
+
+        async def other_worker():
+            await asyncio.sleep(0.1)
+            await other.release()
+
+        async def loader():
+            return b"ours"
+
+        filler = asyncio.ensure_future(other_worker())
+        started = time.monotonic()
+        value = await cache.get_or_load("cache:abandoned", loader)
+        await filler
+        return value, time.monotonic() - started
+
+    value, elapsed = asyncio.run(run())
+    assert value == b"ours"
+    # Well short of CACHE_LOCK_TIMEOUT_MS
+    assert elapsed < 1
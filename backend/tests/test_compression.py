@@ -0,0 +1,75 @@
+import asyncio
+import gzip
+
+import pytest
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from app import compression
+from app.compression import compress_response, negotiate
+from app.http_cache import compute_etag
+
+@pytest.mark.parametrize("header, encoding", [
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0, identity", None),
+    ("GZIP", "gzip"),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_gzip(monkeypatch, header, encoding):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate(header) == encoding
+
+def make_request(accept_encoding="gzip"):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    })
+
+def call_next_with(body, etag=None):
+    async def call_next(request):
+        async def stream():
+            yield body
+
+        headers = {"content-length": str(len(body))}
+        if etag:
+            headers["etag"] = etag
+        return StreamingResponse(stream(), media_type="application/json", headers=headers)
+    return call_next
+
+def run(request, call_next):
+    async def go():
+        response = await compress_response(request, call_next)
+        if hasattr(response, "body_iterator"):
+            return response, b"".join([chunk async for chunk in response.body_iterator])
+        return response, response.body
+    return asyncio.run(go())
+
+def test_small_etagged_body_is_compressed_and_cached(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    monkeypatch.setattr(compression, "_variants", compression.OrderedDict())
+    body = b'{"subdomain":"demo","description":"' + b"x" * 200 + b'"}'
+    etag = compute_etag(body)
+
+    response, data = run(make_request(), call_next_with(body, etag))
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == "W/" + etag
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert gzip.decompress(data) == body
+    assert compression._variants[(etag, "gzip")] == data
+
+def test_small_body_without_etag_is_left_alone(monkeypatch):
+    body = b'{"ok":true}' * 20
+    response, data = run(make_request(), call_next_with(body))
+    assert "content-encoding" not in response.headers
+    assert data == body
+
+def test_incompressible_body_is_sent_plain(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    monkeypatch.setattr(compression, "_variants", compression.OrderedDict())
+    body = bytes(range(200))
+    response, data = run(make_request(), call_next_with(body, compute_etag(body)))
+    assert "content-encoding" not in response.headers
+    assert data == body
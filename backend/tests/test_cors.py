@@ -0,0 +1,63 @@
+import pytest
+from starlette.datastructures import Headers
+
+from app.config import settings
+from app.cors import TenantCORSMiddleware
+from app.host_resolver import host_resolver
+from app.prefilter import _empty_filters, name_prefilter
+
+ROOT = settings.ROOT_DOMAIN
+
+@pytest.fixture
+def cors(monkeypatch):
+    monkeypatch.setattr(host_resolver, "hosts", {"tenant.example.com": "tenant"})
+    monkeypatch.setattr(name_prefilter, "filters", _empty_filters())
+    monkeypatch.setattr(name_prefilter, "ready", True)
+    name_prefilter._add_local("subdomain", "alice")
+    return TenantCORSMiddleware(
+        app=None,
+        allow_origins=["http://localhost:3000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+def preflight_headers(origin):
+    return Headers({"origin": origin, "access-control-request-method": "POST"})
+
+@pytest.mark.parametrize("origin, allowed", [
+    ("http://localhost:3000", True),
+    ("https://tenant.example.com", True),
+    (f"https://alice.{ROOT}", True),
+    (f"https://www.{ROOT}", True),
+    # Not a tenant (the prefilter has never seen it)
+    (f"https://nobody.{ROOT}", False),
+    # Tenants are only ever served over https
+    ("http://tenant.example.com", False),
+    (f"http://alice.{ROOT}", False),
+    # Only one label below the root domain
+    (f"https://x.alice.{ROOT}", False),
+    (f"https://alice.{ROOT}.evil.com", False),
+    ("https://example.com", False),
+])
+def test_is_allowed_origin(cors, origin, allowed):
+    assert cors.is_allowed_origin(origin) is allowed
+
+def test_preflight_success_is_cached(cors):
+    first = cors.preflight_response(preflight_headers("https://tenant.example.com"))
+    assert first.status_code == 200
+    assert first.headers["access-control-allow-origin"] == "https://tenant.example.com"
+    assert cors.preflight_response(preflight_headers("https://tenant.example.com")) is first
+
+def test_preflight_rejection_is_not_cached(cors):
+    rejected = cors.preflight_response(preflight_headers("https://new.example.com"))
+    assert rejected.status_code == 400
+    host_resolver.hosts["new.example.com"] = "new"
+    assert cors.preflight_response(preflight_headers("https://new.example.com")).status_code == 200
+
+def test_preflight_cache_cleared_when_hosts_change(cors, monkeypatch):
+    cors.preflight_response(preflight_headers("https://tenant.example.com"))
+    monkeypatch.setattr(host_resolver, "version", host_resolver.version)
+    host_resolver._apply("tenant.example.com", None)
+    response = cors.preflight_response(preflight_headers("https://tenant.example.com"))
+    assert response.status_code == 400
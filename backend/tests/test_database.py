@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from starlette.requests import Request
+
+from app import database
+from app.auth.jwt import create_access_token
+from sqlalchemy.pool import NullPool
+
+from app.database import (
+    ReplicaRouter, engine_options, get_read_db, mark_recent_write, replica_engine_options,
+)
+
+class FakeSession:
+    def __init__(self, name, healthy=True):
+        self.name = name
+        self.healthy = healthy
+        self.closed = False
+
+    def connection(self):
+        if not self.healthy:
+            raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+    def close(self):
+        self.closed = True
+
+def make_router(*health):
+    router = ReplicaRouter([])
+    router.sessionmakers = [
+        (lambda name=f"replica-{i}", ok=ok: FakeSession(name, ok)) for i, ok in enumerate(health)
+    ]
+    router.down_until = [0.0] * len(health)
+    return router
+
+def make_request(method="GET", token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "method": method, "path": "/", "headers": headers})
+
+def test_replica_engines_time_out_quickly():
+    options = replica_engine_options("postgresql://replica/db")
+    assert options["connect_args"]["connect_timeout"] == database.settings.REPLICA_CONNECT_TIMEOUT_SECONDS
+
+def test_engine_options_without_a_pooler():
+    assert engine_options("postgresql://db/app", pooler="none") == {}
+
+def test_engine_options_behind_pgbouncer():
+    assert engine_options("postgresql://db/app", pooler="pgbouncer", local_pool_size=0) == {"poolclass": NullPool}
+    assert engine_options("postgresql://db/app", pooler="pgbouncer", local_pool_size=4) == {
+        "pool_size": 4, "max_overflow": 0
+    }
+    # psycopg 3 must not switch to server-side prepared statements
+    options = engine_options("postgresql+psycopg://db/app", pooler="pgbouncer", local_pool_size=0)
+    assert options["connect_args"] == {"prepare_threshold": None}
+
+def test_router_round_robins_over_replicas():
+    router = make_router(True, True)
+    names = [router.session().name for _ in range(4)]
+    assert names == ["replica-0", "replica-1", "replica-0", "replica-1"]
+
+def test_router_skips_a_dead_replica_until_retry():
+    router = make_router(False, True)
+    assert [router.session().name for _ in range(3)] == ["replica-1"] * 3
+    assert router.down_until[0] > 0
+    assert router.down_until[1] == 0
+
+def test_router_falls_back_to_primary_when_all_are_down(monkeypatch):
+    router = make_router(False, False)
+    assert router.session() is None
+    monkeypatch.setattr(database, "replica_router", router)
+    monkeypatch.setattr(database, "SessionLocal", lambda: FakeSession("primary"))
+    assert database.open_read_session().name == "primary"
+
+@pytest.fixture
+def replicas(monkeypatch):
+    monkeypatch.setattr(database.settings, "READ_REPLICA_URLS", ["postgresql://replica/db"])
+    monkeypatch.setattr(database, "replica_router", make_router(True))
+    monkeypatch.setattr(database, "SessionLocal", lambda: FakeSession("primary"))
+
+async def read_session(request):
+    dependency = get_read_db(request)
+    db = await dependency.__anext__()
+    await dependency.aclose()
+    return db
+
+def test_reads_go_to_a_replica(fake_redis, replicas):
+    token = create_access_token({"sub": "alice"})
+    db = asyncio.run(read_session(make_request(token=token)))
+    assert db.name == "replica-0"
+    assert db.closed
+
+def test_writer_is_pinned_to_the_primary(fake_redis, replicas):
+    alice = create_access_token({"sub": "alice"})
+    bob = create_access_token({"sub": "bob"})
+
+    async def run():
+        await mark_recent_write(make_request("POST", alice))
+        alice_db = await read_session(make_request(token=alice))
+        bob_db = await read_session(make_request(token=bob))
+        return alice_db, bob_db, await fake_redis.ttl("recent_write:alice")
+
+    alice_db, bob_db, ttl = asyncio.run(run())
+    assert alice_db.name == "primary"
+    # Only the user who wrote is pinned
+    assert bob_db.name == "replica-0"
+    assert ttl > 0
+
+def test_anonymous_writes_pin_nobody(fake_redis, replicas):
+    async def run():
+        await mark_recent_write(make_request("POST"))
+        return await fake_redis.keys("recent_write:*")
+
+    assert asyncio.run(run()) == []
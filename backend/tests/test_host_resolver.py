@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from app import host_resolver as host_resolver_module
+from app.config import settings
+from app.host_resolver import HOSTS_CHANNEL, HostResolver, normalize_host
+from app.models.user import CustomDomain, Subdomain, User
+
+ROOT = settings.ROOT_DOMAIN
+
+@pytest.fixture
+def resolver():
+    resolver = HostResolver()
+    resolver.hosts = {"blog.example.com": "alice"}
+    return resolver
+
+def test_normalize_host():
+    assert normalize_host("Blog.Example.com:8443") == "blog.example.com"
+    assert normalize_host("blog.example.com.") == "blog.example.com"
+
+@pytest.mark.parametrize("host, tenant", [
+    ("blog.example.com", "alice"),
+    ("BLOG.example.com:443", "alice"),
+    (f"bob.{ROOT}", "bob"),
+    (f"bob.{ROOT}.", "bob"),
+    # Platform hosts and anything that isn't exactly one label deep
+    (f"api.{ROOT}", None),
+    (f"www.{ROOT}", None),
+    (ROOT, None),
+    (f"x.bob.{ROOT}", None),
+    (f"bob{ROOT}", None),
+    ("unknown.example.com", None),
+])
+def test_resolve(resolver, host, tenant):
+    assert resolver.resolve(host) == tenant
+
+def test_updates_are_published_and_applied_by_peers(fake_redis):
+    async def run():
+        local, peer = HostResolver(), HostResolver()
+        listener = asyncio.ensure_future(peer.listen())
+        await peer.wait_until_subscribed(timeout=1)
+        version = peer.version
+
+        await local.set(["shop.example.com"], "alice")
+        await local.remove(["old.example.com"])
+        for _ in range(50):
+            if peer.version >= version + 2:
+                break
+            await asyncio.sleep(0.01)
+        listener.cancel()
+        return local, peer
+
+    local, peer = asyncio.run(run())
+    assert local.resolve("shop.example.com") == "alice"
+    assert peer.resolve("shop.example.com") == "alice"
+    assert peer.resolve("old.example.com") is None
+
+def test_rebuild_replays_updates_made_during_the_scan(fake_redis, monkeypatch):
+    async def run():
+        resolver = HostResolver()
+        scan_started = threading.Event()
+        finish_scan = threading.Event()
+
+        def slow_scan():
+            scan_started.set()
+            finish_scan.wait(5)
+            return {"old.example.com": "alice", "kept.example.com": "bob"}
+
+        monkeypatch.setattr(resolver, "_scan", slow_scan)
+        listener = asyncio.ensure_future(resolver.listen())
+        await resolver.wait_until_subscribed(timeout=1)
+        rebuild = asyncio.ensure_future(resolver.rebuild())
+        await asyncio.to_thread(scan_started.wait, 5)
+
+        await fake_redis.publish(HOSTS_CHANNEL, "new.example.com carol")
+        await fake_redis.publish(HOSTS_CHANNEL, "old.example.com")
+        for _ in range(50):
+            if len(resolver._replay) == 2:
+                break
+            await asyncio.sleep(0.01)
+        finish_scan.set()
+        await rebuild
+        listener.cancel()
+        return resolver
+
+    resolver = asyncio.run(run())
+    assert resolver.ready
+    assert resolver.hosts == {"kept.example.com": "bob", "new.example.com": "carol"}
+
+def test_scan_serves_verified_domains_of_live_accounts(db_sessionmaker, monkeypatch):
+    db = db_sessionmaker()
+    now = datetime.now(timezone.utc)
+    alice = User(email="a@example.com", username="alice", provider="email")
+    gone = User(email="g@example.com", username="gone", provider="email", deleted_at=now)
+    db.add_all([alice, gone])
+    db.flush()
+    alice_site = Subdomain(user_id=alice.id, subdomain="alice")
+    gone_site = Subdomain(user_id=gone.id, subdomain="gone")
+    db.add_all([alice_site, gone_site])
+    db.flush()
+    db.add_all([
+        CustomDomain(subdomain_id=alice_site.id, domain="alice.example.com", verification_token="t1", verified_at=now),
+        CustomDomain(subdomain_id=alice_site.id, domain="pending.example.com", verification_token="t2"),
+        CustomDomain(subdomain_id=gone_site.id, domain="gone.example.com", verification_token="t3", verified_at=now),
+    ])
+    db.commit()
+    db.close()
+
+    monkeypatch.setattr(host_resolver_module, "SessionLocal", db_sessionmaker)
+    assert HostResolver()._scan() == {"alice.example.com": "alice"}
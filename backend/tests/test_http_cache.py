@@ -0,0 +1,51 @@
+from starlette.requests import Request
+
+from app.http_cache import CACHE_CONTROL, compute_etag, conditional_response, etag_matches
+
+def make_request(headers=()):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+    })
+
+def test_etag_is_stable_and_strong():
+    etag = compute_etag(b'{"a":1}')
+    assert etag == compute_etag(b'{"a":1}')
+    assert etag != compute_etag(b'{"a":2}')
+    assert etag.startswith('"') and etag.endswith('"')
+
+def test_etag_matches_uses_weak_comparison():
+    etag = compute_etag(b"body")
+    assert etag_matches(etag, etag)
+    assert etag_matches("W/" + etag, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches("", etag)
+    assert not etag_matches(None, etag)
+
+def test_conditional_response_full_body():
+    body = b'{"subdomain":"demo"}'
+    response = conditional_response(make_request(), body)
+    assert response.status_code == 200
+    assert response.body == body
+    assert response.headers["etag"] == compute_etag(body)
+    assert response.headers["cache-control"] == CACHE_CONTROL
+
+def test_conditional_response_not_modified():
+    body = b'{"subdomain":"demo"}'
+    etag = compute_etag(body)
+    response = conditional_response(make_request([("if-none-match", etag)]), body)
+    assert response.status_code == 304
+    assert response.body == b""
+    # A 304 repeats the validator and caching policy
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == CACHE_CONTROL
+
+def test_conditional_response_matches_compressed_variant_etag():
+    # Compression turns the ETag weak; the client sends that back
+    body = b'{"subdomain":"demo"}'
+    request = make_request([("if-none-match", "W/" + compute_etag(body))])
+    assert conditional_response(request, body).status_code == 304
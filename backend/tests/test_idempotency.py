@@ -0,0 +1,171 @@
+import asyncio
+import time
+
+import orjson
+import pytest
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from app.idempotency import idempotent_call
+
+def make_request(path, body, key="key-1", authorization=None):
+    headers = [(b"idempotency-key", key.encode()), (b"content-type", b"application/json")]
+    if authorization:
+        headers.append((b"authorization", authorization.encode()))
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": headers,
+        "client": ("203.0.113.7", 1234),
+    }
+    return Request(scope, receive)
+
+class Handler:
+    # Stands in for the route behind call_next; counts how often it runs
+    def __init__(self, status_code=201):
+        self.calls = 0
+        self.bodies = []
+        self.status_code = status_code
+
+    async def __call__(self, request):
+        self.calls += 1
+        self.bodies.append(await request.body())
+        payload = orjson.dumps({"call": self.calls})
+
+        async def stream():
+            yield payload
+
+        return StreamingResponse(
+            stream(), status_code=self.status_code, media_type="application/json",
+            headers={"content-length": str(len(payload)), "set-cookie": "session=secret"}
+        )
+
+async def read(response):
+    if hasattr(response, "body_iterator"):
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return response.body
+
+def test_retry_replays_the_stored_response(fake_redis):
+    async def run():
+        handler = Handler()
+        first = await idempotent_call(make_request("/subdomains/", b'{"subdomain":"a"}'), handler)
+        second = await idempotent_call(make_request("/subdomains/", b'{"subdomain":"a"}'), handler)
+        return handler, first, second
+
+    handler, first, second = asyncio.run(run())
+    assert handler.calls == 1
+    # The route still sees the body the middleware buffered
+    assert handler.bodies == [b'{"subdomain":"a"}']
+    assert first.status_code == second.status_code == 201
+    assert asyncio.run(read(second)) == b'{"call":1}'
+    assert second.headers["idempotent-replayed"] == "true"
+    assert "set-cookie" not in second.headers
+
+def test_reused_key_with_different_body_is_rejected(fake_redis):
+    async def run():
+        handler = Handler()
+        await idempotent_call(make_request("/subdomains/", b'{"subdomain":"a"}'), handler)
+        return handler, await idempotent_call(make_request("/subdomains/", b'{"subdomain":"b"}'), handler)
+
+    handler, response = asyncio.run(run())
+    assert handler.calls == 1
+    assert response.status_code == 422
+
+def test_keys_are_scoped_per_client(fake_redis):
+    async def run():
+        handler = Handler()
+        await idempotent_call(make_request("/subdomains/", b"{}", authorization="Bearer one"), handler)
+        await idempotent_call(make_request("/subdomains/", b"{}", authorization="Bearer two"), handler)
+        return handler
+
+    assert asyncio.run(run()).calls == 2
+
+def test_credential_responses_are_not_stored(fake_redis):
+    async def run():
+        handler = Handler(status_code=200)
+        path = "/subdomains/my/admin-token"
+        first = await idempotent_call(make_request(path, b"", authorization="Bearer one"), handler)
+        second = await idempotent_call(make_request(path, b"", authorization="Bearer one"), handler)
+        stored = [await fake_redis.hget(key, "body") for key in await fake_redis.keys("idempotency:*")]
+        return handler, await read(first), second, await read(second), stored
+
+    handler, first_body, second, second_body, stored = asyncio.run(run())
+    assert handler.calls == 1
+    assert first_body == b'{"call":1}'
+    assert second.status_code == 409
+    assert b"call" not in second_body
+    assert all(b"call" not in body for body in stored)
+
+def test_other_routes_pass_through(fake_redis):
+    async def run():
+        handler = Handler()
+        await idempotent_call(make_request("/auth/login", b"{}"), handler)
+        await idempotent_call(make_request("/auth/login", b"{}"), handler)
+        return handler
+
+    assert asyncio.run(run()).calls == 2
+
+def test_server_errors_are_not_pinned(fake_redis):
+    async def run():
+        handler = Handler(status_code=503)
+        await idempotent_call(make_request("/subdomains/", b"{}"), handler)
+        await idempotent_call(make_request("/subdomains/", b"{}"), handler)
+        return handler
+
+    assert asyncio.run(run()).calls == 2
+
+def test_concurrent_retry_replays_the_first_result(fake_redis):
+    async def run():
+        handler = Handler()
+        first_started = asyncio.Event()
+
+        async def slow(request):
+            first_started.set()
+            await asyncio.sleep(0.2)
+            return await handler(request)
+
+        first = asyncio.ensure_future(idempotent_call(make_request("/subdomains/", b"{}"), slow))
+        await first_started.wait()
+        second = await idempotent_call(make_request("/subdomains/", b"{}"), handler)
+        return handler, await first, second
+
+    handler, first, second = asyncio.run(run())
+    assert handler.calls == 1
+    assert first.status_code == second.status_code == 201
+    assert second.headers["idempotent-replayed"] == "true"
+
+def test_concurrent_retry_runs_once_a_failed_attempt_releases(fake_redis):
+    async def run():
+        handler = Handler()
+        first_started = asyncio.Event()
+
+        async def failing(request):
+            first_started.set()
+            await asyncio.sleep(0.2)
+            raise RuntimeError("boom")
+
+        first = asyncio.ensure_future(idempotent_call(make_request("/subdomains/", b"{}"), failing))
+        await first_started.wait()
+        started = time.monotonic()
+        second = await idempotent_call(make_request("/subdomains/", b"{}"), handler)
+        elapsed = time.monotonic() - started
+        with pytest.raises(RuntimeError):
+            await first
+        return handler, second, elapsed
+
+    handler, second, elapsed = asyncio.run(run())
+    # The retry ran for real instead of waiting out IDEMPOTENCY_LOCK_MS
+    assert handler.calls == 1
+    assert second.status_code == 201
+    assert "idempotent-replayed" not in second.headers
+    assert elapsed < 2
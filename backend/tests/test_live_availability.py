@@ -0,0 +1,61 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routes import subdomains
+
+@pytest.fixture
+def checks(monkeypatch):
+    calls = []
+    taken = set()
+
+    def check(kind, name):
+        calls.append((kind, name))
+        return {"available": name not in taken, "reason": "Already taken" if name in taken else None}
+
+    monkeypatch.setattr(subdomains, "run_availability_check", check)
+    monkeypatch.setattr(subdomains.settings, "LIVE_CHECK_DEBOUNCE_MS", 0)
+    app = FastAPI()
+    app.include_router(subdomains.router, prefix="/subdomains")
+    with TestClient(app).websocket_connect("/subdomains/check/ws") as ws:
+        yield ws, calls, taken
+
+def test_answers_a_name(checks):
+    ws, calls, _ = checks
+    ws.send_json({"id": 1, "kind": "subdomain", "name": "demo"})
+    assert ws.receive_json() == {"id": 1, "kind": "subdomain", "name": "demo", "available": True, "reason": None}
+    assert calls == [("subdomain", "demo")]
+
+@pytest.mark.parametrize("kind", [["subdomain"], {"a": 1}, 7, "domain"])
+def test_rejects_unknown_kinds_without_closing(checks, kind):
+    ws, calls, _ = checks
+    ws.send_json({"id": 2, "kind": kind, "name": "demo"})
+    assert ws.receive_json() == {"id": 2, "error": "Unknown kind"}
+    # The socket is still usable
+    ws.send_json({"id": 3, "name": "demo"})
+    assert ws.receive_json()["id"] == 3
+
+def test_rejects_malformed_messages(checks):
+    ws, _, _ = checks
+    ws.send_text("not json")
+    assert "error" in ws.receive_json()
+    ws.send_json(["name"])
+    assert "error" in ws.receive_json()
+
+def test_answers_are_reused_briefly(checks):
+    ws, calls, _ = checks
+    for request_id in (1, 2):
+        ws.send_json({"id": request_id, "name": "demo"})
+        assert ws.receive_json()["available"]
+    assert len(calls) == 1
+
+def test_expired_answers_are_checked_again(checks, monkeypatch):
+    ws, calls, taken = checks
+    monkeypatch.setattr(subdomains.settings, "LIVE_CHECK_ANSWER_TTL_SECONDS", 0)
+    ws.send_json({"id": 1, "name": "demo"})
+    assert ws.receive_json()["available"]
+    # Someone else takes it; the socket must not keep saying it's free
+    taken.add("demo")
+    ws.send_json({"id": 2, "name": "demo"})
+    assert ws.receive_json()["available"] is False
+    assert len(calls) == 2
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app import load_shedding
+from app.load_shedding import AdaptiveLimiter, LoadShedder, shed_or_call
+
+def make_request(method, path):
+    return Request({"type": "http", "method": method, "path": path, "headers": []})
+
+@pytest.mark.parametrize("method, path, name", [
+    ("GET", "/health", None),
+    ("GET", "/users/profile/alice", "read"),
+    ("HEAD", "/", "read"),
+    ("POST", "/subdomains/", "write"),
+    ("DELETE", "/users/me", "write"),
+    ("POST", "/auth/login", "auth"),
+    ("POST", "/auth/signup", "auth"),
+    # GETs that call the provider or write are not cheap reads
+    ("GET", "/auth/github/callback", "auth"),
+    ("GET", "/auth/discord/callback", "auth"),
+    ("GET", "/auth/verify-email", "write"),
+    ("POST", "/subdomains/my/domains/example.com/verify", "auth"),
+])
+def test_classify(method, path, name):
+    limiter = LoadShedder().classify(make_request(method, path))
+    assert (limiter.name if limiter else None) == name
+
+def limiter(**overrides):
+    options = dict(name="test", target_ms=100, initial=32, min_limit=4, max_limit=64, shed_at=1.0)
+    options.update(overrides)
+    return AdaptiveLimiter(**options)
+
+def test_slow_burst_cuts_the_limit_once():
+    aimd = limiter()
+    started = time.perf_counter()
+    for _ in range(10):
+        aimd.in_flight += 1
+        aimd.release(started, latency_ms=500)
+    # All ten started before the first cut, so they count as one signal
+    assert aimd.limit == pytest.approx(32 * load_shedding.settings.LOAD_SHED_BACKOFF)
+
+def test_requests_after_a_cut_can_cut_again():
+    aimd = limiter()
+    aimd.release(time.perf_counter(), latency_ms=500)
+    aimd.release(time.perf_counter(), latency_ms=500)
+    assert aimd.limit == pytest.approx(32 * load_shedding.settings.LOAD_SHED_BACKOFF ** 2)
+
+def test_limit_stays_within_bounds():
+    aimd = limiter(initial=5, max_limit=6)
+    for _ in range(100):
+        aimd.release(time.perf_counter(), latency_ms=500)
+    assert aimd.limit == aimd.min_limit
+    for _ in range(1000):
+        aimd.release(time.perf_counter(), latency_ms=1)
+    assert aimd.limit == aimd.max_limit
+
+def test_fast_responses_grow_about_one_per_window():
+    aimd = limiter(initial=10)
+    for _ in range(10):
+        aimd.release(time.perf_counter(), latency_ms=1)
+    assert 10.9 < aimd.limit < 11
+
+def test_try_acquire_respects_class_and_worker_limits(monkeypatch):
+    monkeypatch.setattr(load_shedding.settings, "LOAD_SHED_MAX_IN_FLIGHT", 10)
+    shedder = LoadShedder()
+    auth, read = shedder.limiters["auth"], shedder.limiters["read"]
+    # Auth sheds at 75% of the worker-wide cap, reads only at 100%
+    shedder.in_flight = 8
+    assert not shedder.try_acquire(auth)
+    assert shedder.try_acquire(read)
+    assert shedder.in_flight == 9 and read.in_flight == 1
+
+    shedder.in_flight = 0
+    auth.limit = 2
+    assert shedder.try_acquire(auth) and shedder.try_acquire(auth)
+    assert not shedder.try_acquire(auth)
+
+def test_shed_or_call_answers_503_when_full(monkeypatch):
+    shedder = LoadShedder()
+    shedder.limiters["write"].limit = 1
+    monkeypatch.setattr(load_shedding, "load_shedder", shedder)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def call_next(request):
+            await release.wait()
+            return Response("ok")
+
+        first = asyncio.ensure_future(shed_or_call(make_request("POST", "/subdomains/"), call_next))
+        await asyncio.sleep(0)
+        shed = await shed_or_call(make_request("POST", "/subdomains/"), call_next)
+        release.set()
+        return shed, await first
+
+    shed, first = asyncio.run(run())
+    assert first.status_code == 200
+    assert shed.status_code == 503
+    assert shed.headers["x-shed-class"] == "write"
+    assert shed.headers["retry-after"] == str(load_shedding.settings.LOAD_SHED_RETRY_AFTER_SECONDS)
+    # Everything was released again
+    assert shedder.in_flight == 0 and shedder.limiters["write"].in_flight == 0
@@ -0,0 +1,73 @@
+import pytest
+
+from app import name_policy
+from app.config import settings
+from app.name_policy import (
+    BlocklistMatcher, check_subdomain, check_username, load_blocklist, skeleton,
+    validate_custom_domain,
+)
+
+def test_matcher_finds_terms_anywhere():
+    matcher = BlocklistMatcher(["he", "she", "his", "hers"])
+    assert matcher.size == 4
+    # Overlapping terms are found through the failure links
+    assert matcher.find("ushers") == "she"
+    assert matcher.find("xhisx") == "his"
+    assert matcher.find("abc") is None
+
+def test_matcher_reports_suffix_matches():
+    # "bcd" ends inside "abcx"'s path, so only the fail link reaches it
+    matcher = BlocklistMatcher(["abcx", "bcd"])
+    assert matcher.find("abcd") == "bcd"
+
+def test_matcher_ignores_duplicates_and_handles_empty():
+    assert BlocklistMatcher(["bad", "bad"]).size == 1
+    assert BlocklistMatcher([]).find("anything") is None
+
+def test_skeleton_folds_lookalikes_and_separators():
+    assert skeleton("4dm1n") == skeleton("admin")
+    assert skeleton("аdmin") == skeleton("admin")  # Cyrillic а
+    assert skeleton("ＡＤＭＩＮ") == skeleton("admin")  # fullwidth
+    assert skeleton("a-d_m.i n") == skeleton("admin")
+
+@pytest.mark.parametrize("name, reason", [
+    ("my-site", None),
+    ("-bad", "Invalid format"),
+    ("my_site", "Invalid format"),
+    ("www", "Reserved name"),
+    ("WWW", "Reserved name"),
+    ("admin", "Reserved name"),
+])
+def test_check_subdomain(name, reason):
+    assert check_subdomain(name) == reason
+
+@pytest.mark.parametrize("name", ["apl", "heip", "mai1", "b1og", "n3ws", "5h0p", "4dm1n"])
+def test_names_resembling_reserved_subdomains_are_allowed(name):
+    assert check_subdomain(name) is None
+
+def test_check_username_reserved():
+    assert check_username("Root") == "Reserved name"
+    assert check_username("rooted") is None
+    assert check_username("r-o-o-t") is None
+    assert check_username("r00t") is None
+
+def test_blocklist_still_catches_lookalikes(monkeypatch):
+    monkeypatch.setattr(name_policy, "blocklist", BlocklistMatcher([skeleton("badword")]))
+    assert check_username("b4d-w0rd") == "Name not allowed"
+    assert check_subdomain("my-badword") == "Name not allowed"
+    assert check_subdomain("good") is None
+
+def test_load_blocklist(tmp_path):
+    path = tmp_path / "blocklist.txt"
+    path.write_text("# comment\n\nBadWord  # trailing\nsl-ur\n", encoding="utf-8")
+    assert load_blocklist(str(path)) == [skeleton("badword"), skeleton("slur")]
+    assert load_blocklist("") == []
+
+def test_validate_custom_domain():
+    root = settings.ROOT_DOMAIN
+    assert validate_custom_domain("example.com")
+    assert validate_custom_domain("blog.example.co.uk")
+    assert not validate_custom_domain(root)
+    assert not validate_custom_domain(f"tenant.{root}")
+    assert not validate_custom_domain("localhost")
+    assert not validate_custom_domain("-bad.example.com")
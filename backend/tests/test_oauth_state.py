@@ -0,0 +1,138 @@
+import asyncio
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.auth.oauth_state import (
+    BINDING_COOKIE, OAuthStateError, binding_matches, issue_state, run_callback_once, state_binding,
+)
+from app.database import get_db
+from app.routes import auth
+
+def test_binding_is_specific_to_provider_and_state():
+    binding = state_binding("github", "state-1")
+    assert binding_matches("github", "state-1", binding)
+    assert not binding_matches("discord", "state-1", binding)
+    assert not binding_matches("github", "state-2", binding)
+    assert not binding_matches("github", "state-1", None)
+    assert not binding_matches("github", None, binding)
+
+class Exchange:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return f"jwt-{self.calls}"
+
+def test_duplicate_callbacks_share_one_exchange(fake_redis):
+    async def run():
+        exchange = Exchange()
+        state = await issue_state("github")
+        binding = state_binding("github", state)
+        results = await asyncio.gather(*(
+            run_callback_once("github", "code", state, binding, exchange) for _ in range(5)
+        ))
+        # A retry after the first finished gets the stored result
+        results.append(await run_callback_once("github", "code", state, binding, exchange))
+        return exchange.calls, results
+
+    calls, results = asyncio.run(run())
+    assert calls == 1
+    assert results == ["jwt-1"] * 6
+
+def test_state_is_single_use(fake_redis):
+    async def run():
+        exchange = Exchange()
+        state = await issue_state("github")
+        binding = state_binding("github", state)
+        await run_callback_once("github", "code-1", state, binding, exchange)
+        with pytest.raises(OAuthStateError, match="Invalid or expired"):
+            await run_callback_once("github", "code-2", state, binding, exchange)
+        return exchange.calls
+
+    assert asyncio.run(run()) == 1
+
+def test_another_browser_gets_nothing(fake_redis):
+    async def run():
+        exchange = Exchange()
+        state = await issue_state("github")
+        binding = state_binding("github", state)
+        await run_callback_once("github", "code", state, binding, exchange)
+        # Same callback URL, replayed without the cookie
+        with pytest.raises(OAuthStateError, match="different browser"):
+            await run_callback_once("github", "code", state, None, exchange)
+        with pytest.raises(OAuthStateError, match="different browser"):
+            await run_callback_once("github", "code", state, state_binding("github", "other"), exchange)
+
+    asyncio.run(run())
+
+def test_unknown_state_is_rejected(fake_redis):
+    async def run():
+        exchange = Exchange()
+        binding = state_binding("github", "never-issued")
+        with pytest.raises(OAuthStateError):
+            await run_callback_once("github", "code", "never-issued", binding, exchange)
+        return exchange.calls
+
+    assert asyncio.run(run()) == 0
+
+@pytest.fixture
+def client(fake_redis, monkeypatch):
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/auth")
+    app.dependency_overrides[get_db] = lambda: None
+    # The binding cookie is Secure when BASE_URL is https
+    # One event loop for every request, as the fake Redis client requires
+    with TestClient(app, base_url="https://testserver") as client:
+        client.follow_redirects = False
+        yield client
+
+def start_login(client):
+    response = client.get("/auth/github")
+    assert response.status_code == 307
+    state = parse_qs(urlparse(response.headers["location"]).query)["state"][0]
+    assert BINDING_COOKIE in response.cookies
+    return state
+
+def test_login_round_trip(client, monkeypatch):
+    async def exchange(client, provider, code, db):
+        return "jwt-token"
+
+    monkeypatch.setattr(auth, "exchange_oauth_code", exchange)
+    state = start_login(client)
+    response = client.get("/auth/github/callback", params={"code": "abc", "state": state})
+    assert response.status_code == 307
+    assert response.headers["location"].endswith("token=jwt-token")
+    # The binding is cleared once used
+    assert 'oauth_binding=""' in response.headers["set-cookie"]
+
+def test_callback_without_the_cookie_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(auth, "exchange_oauth_code", lambda *args: pytest.fail("exchanged"))
+    state = start_login(client)
+    client.cookies.clear()
+    response = client.get("/auth/github/callback", params={"code": "abc", "state": state})
+    assert response.status_code == 400
+
+def test_callback_errors_are_not_leaked(client, monkeypatch, caplog):
+    async def exchange(client, provider, code, db):
+        raise RuntimeError("database password is hunter2")
+
+    monkeypatch.setattr(auth, "exchange_oauth_code", exchange)
+    state = start_login(client)
+    response = client.get("/auth/github/callback", params={"code": "abc", "state": state})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "OAuth login failed"}
+    assert "hunter2" in caplog.text
+
+def test_callback_http_errors_pass_through(client, monkeypatch):
+    async def exchange(client, provider, code, db):
+        raise HTTPException(status_code=409, detail="Account conflict")
+
+    monkeypatch.setattr(auth, "exchange_oauth_code", exchange)
+    state = start_login(client)
+    response = client.get("/auth/github/callback", params={"code": "abc", "state": state})
+    assert response.status_code == 409
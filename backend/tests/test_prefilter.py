@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+from app.prefilter import PREFILTER_CHANNEL, BloomFilter, NamePrefilter, _empty_filters
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    names = [f"tenant-{i}" for i in range(1000)]
+    for name in names:
+        bloom.add(name)
+    assert all(name in bloom for name in names)
+
+def test_bloom_filter_false_positive_rate_is_near_target():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"tenant-{i}")
+    false_positives = sum(f"free-{i}" in bloom for i in range(10000))
+    # 1% target at capacity; leave headroom for hash variance
+    assert false_positives < 300
+
+def test_bloom_filter_sizing():
+    bloom = BloomFilter(1000, 0.01)
+    # m = -n ln p / (ln 2)^2 and k = m/n ln 2
+    assert bloom.size == 9585
+    assert bloom.hash_count == 7
+    assert len(bloom.bits) == (bloom.size + 7) // 8
+
+def test_prefilter_says_maybe_until_ready():
+    prefilter = NamePrefilter()
+    assert prefilter.might_exist("subdomain", "anything")
+    prefilter.ready = True
+    assert not prefilter.might_exist("subdomain", "anything")
+    prefilter._add_local("subdomain", "anything")
+    assert prefilter.might_exist("subdomain", "anything")
+    assert not prefilter.might_exist("username", "anything")
+
+def test_prefilter_records_replay_during_rebuild():
+    prefilter = NamePrefilter()
+    prefilter._replay = []
+    prefilter._add_local("email", "a@example.com")
+    assert prefilter._replay == [("email", "a@example.com")]
+
+def scanned(*subdomains):
+    filters = _empty_filters()
+    for name in subdomains:
+        filters["subdomain"].add(name)
+    return filters
+
+def test_rebuild_keeps_names_taken_during_the_scan(fake_redis, monkeypatch):
+    async def run():
+        prefilter = NamePrefilter()
+        scan_started = threading.Event()
+        finish_scan = threading.Event()
+
+        def slow_scan():
+            scan_started.set()
+            finish_scan.wait(5)
+            return scanned("existing")
+
+        monkeypatch.setattr(prefilter, "_scan", slow_scan)
+        listener = asyncio.ensure_future(prefilter.listen())
+        await prefilter.wait_until_subscribed(timeout=1)
+        rebuild = asyncio.ensure_future(prefilter.rebuild())
+        await asyncio.to_thread(scan_started.wait, 5)
+
+        # Another worker takes a name after the scan read the table
+        await fake_redis.publish(PREFILTER_CHANNEL, "subdomain:latecomer")
+        for _ in range(50):
+            if prefilter._replay:
+                break
+            await asyncio.sleep(0.01)
+        finish_scan.set()
+        await rebuild
+        listener.cancel()
+        return prefilter
+
+    prefilter = asyncio.run(run())
+    assert prefilter.ready
+    assert prefilter.might_exist("subdomain", "existing")
+    assert prefilter.might_exist("subdomain", "latecomer")
+    assert not prefilter.might_exist("subdomain", "free")
+
+def test_listener_rebuilds_when_it_subscribes_after_a_build(fake_redis, monkeypatch):
+    async def run():
+        prefilter = NamePrefilter()
+        scans = []
+        monkeypatch.setattr(prefilter, "_scan", lambda: scans.append(1) or scanned())
+        # Built while Redis was unreachable
+        await prefilter.rebuild()
+        listener = asyncio.ensure_future(prefilter.listen())
+        await prefilter.wait_until_subscribed(timeout=1)
+        for _ in range(50):
+            if len(scans) == 2:
+                break
+            await asyncio.sleep(0.01)
+        listener.cancel()
+        return scans
+
+    assert len(asyncio.run(run())) == 2
+
+def test_wait_until_subscribed_gives_up(caplog):
+    prefilter = NamePrefilter()
+    asyncio.run(prefilter.wait_until_subscribed(timeout=0.01))
+    assert "not subscribed" in caplog.text
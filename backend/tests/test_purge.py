@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import purge
+from app.auth.jwt import create_access_token
+from app.database import get_db
+from app.models.user import AdminToken, CustomDomain, EmailVerification, Subdomain, TenantTraffic, User
+from app.routes import users
+
+def add_account(db, name, deleted=False):
+    now = datetime.now(timezone.utc)
+    user = User(email=f"{name}@example.com", username=name, provider="email", deleted_at=now if deleted else None)
+    db.add(user)
+    db.flush()
+    site = Subdomain(user_id=user.id, subdomain=name)
+    db.add(site)
+    db.flush()
+    db.add_all([
+        AdminToken(user_id=user.id, token_hash="hash"),
+        EmailVerification(user_id=user.id, token=f"token-{name}", expires_at=now + timedelta(days=1)),
+        CustomDomain(subdomain_id=site.id, domain=f"{name}.example.com", verification_token="t", verified_at=now),
+        TenantTraffic(subdomain_id=site.id, day=now.date(), requests=1, unique_visitors=1),
+    ])
+    db.commit()
+    return user.id
+
+def row_counts(db):
+    return {
+        model.__tablename__: db.query(model).count()
+        for model in (User, Subdomain, AdminToken, EmailVerification, CustomDomain, TenantTraffic)
+    }
+
+@pytest.fixture
+def db(db_sessionmaker, monkeypatch):
+    monkeypatch.setattr(purge, "SessionLocal", db_sessionmaker)
+    session = db_sessionmaker()
+    yield session
+    session.close()
+
+def test_purge_user_cascades_to_every_child(db):
+    gone = add_account(db, "gone", deleted=True)
+    add_account(db, "kept")
+    purge.purge_user(gone)
+    db.expire_all()
+    assert row_counts(db) == {
+        "users": 1, "subdomains": 1, "admin_tokens": 1,
+        "email_verifications": 1, "custom_domains": 1, "tenant_traffic": 1,
+    }
+    assert db.query(User.username).scalar() == "kept"
+
+def test_purge_user_leaves_live_accounts_alone(db):
+    live = add_account(db, "live")
+    purge.purge_user(live)
+    db.expire_all()
+    assert db.get(User, live) is not None
+
+def test_purge_deleted_users_catches_up(db):
+    add_account(db, "one", deleted=True)
+    add_account(db, "two", deleted=True)
+    add_account(db, "kept")
+    purge.purge_deleted_users()
+    db.expire_all()
+    assert [name for (name,) in db.query(User.username)] == ["kept"]
+    assert db.query(Subdomain).count() == 1
+
+def test_delete_account_soft_deletes_then_purges(db, db_sessionmaker, fake_redis):
+    add_account(db, "alice")
+    purged = []
+    app = FastAPI()
+    app.include_router(users.router, prefix="/users")
+
+    def session():
+        s = db_sessionmaker()
+        try:
+            yield s
+        finally:
+            s.close()
+
+    app.dependency_overrides[get_db] = session
+    token = create_access_token({"sub": "alice"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def purge_user(user_id):
+        # Look before the background purge runs: the account is only hidden
+        s = db_sessionmaker()
+        user = s.get(User, user_id)
+        purged.append((user.is_active, user.deleted_at is not None))
+        s.close()
+        purge.purge_user(user_id)
+
+    with pytest.MonkeyPatch.context() as mp, TestClient(app) as client:
+        mp.setattr(users, "purge_user", purge_user)
+        assert client.delete("/users/me", headers=headers).status_code == 200
+        # The token still verifies, but the account no longer resolves
+        assert client.get("/users/me", headers=headers).status_code == 401
+
+    assert purged == [(False, True)]
+    db.expire_all()
+    assert row_counts(db)["users"] == 0
+    assert row_counts(db)["custom_domains"] == 0
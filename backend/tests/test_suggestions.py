@@ -0,0 +1,58 @@
+import pytest
+
+from app.name_policy import validate_subdomain
+from app.prefilter import _empty_filters, name_prefilter
+from app.routes import subdomains
+from app.suggestions import MAX_LENGTH, _fit, suggest_subdomains, transliterate
+
+@pytest.fixture
+def prefilter(monkeypatch):
+    monkeypatch.setattr(name_prefilter, "filters", _empty_filters())
+    monkeypatch.setattr(name_prefilter, "ready", True)
+
+def test_fit_trims_the_stem():
+    assert _fit("a" * 40, "site") == "a" * 25 + "-site"
+    assert _fit("abc-def", "hq", "") == "abc-defhq"
+    # No dangling dash where the stem was cut
+    assert _fit("a" * 24 + "-bcd", "site") == "a" * 24 + "-site"
+
+def test_fit_skips_extras_that_leave_no_room():
+    # room used to go negative and slice from the end of the stem
+    assert _fit("short", "x" * 29) is None
+    assert _fit("short", "x" * 40) is None
+    assert _fit("short", "x" * 28) == "s-" + "x" * 28
+
+def test_long_names_still_get_suggestions(prefilter):
+    suggestions = suggest_subdomains(None, "a" * 64, "u" * 20, limit=50)
+    assert suggestions
+    assert all(len(s) <= MAX_LENGTH and validate_subdomain(s) for s in suggestions)
+
+def test_transliterate():
+    assert transliterate("Straße Café") == "strasse-cafe"
+    assert transliterate("__a..b__") == "a-b"
+
+def test_suggestions_are_valid_and_exclude_the_name(prefilter):
+    suggestions = suggest_subdomains(None, "demo", "some_user", limit=50)
+    assert suggestions
+    assert "demo" not in suggestions
+    assert all(validate_subdomain(s) for s in suggestions)
+    assert len(suggestions) == len(set(suggestions))
+
+def test_invalid_names_get_no_suggestions(prefilter, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("suggestions were computed for an invalid name")
+
+    monkeypatch.setattr(subdomains, "suggest_subdomains", fail)
+    result = subdomains.subdomain_availability(None, "-bad-")
+    assert result == {"available": False, "reason": "Invalid format", "suggestions": []}
+    assert subdomains.subdomain_availability(None, "www")["suggestions"] == []
+
+def test_free_names_get_no_suggestions(prefilter):
+    assert subdomains.subdomain_availability(None, "fresh-name") == {
+        "available": True, "reason": None, "suggestions": []
+    }
+
+def test_taken_detail_is_structured(prefilter):
+    detail = subdomains.taken_detail(None, "demo", "alice")
+    assert detail["message"] == "Subdomain already taken"
+    assert "demo-site" in detail["suggestions"]
@@ -0,0 +1,93 @@
+import os
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+
+from app import database, tenant_map
+from app.models.user import User, Subdomain, CustomDomain
+from app.tenant_map import _parse, _render, rebuild_tenant_map, tenant_host, update_tenant_map
+
+@pytest.fixture(params=["nginx", "json"])
+def map_path(request, tmp_path, monkeypatch):
+    path = tmp_path / "tenants.map"
+    monkeypatch.setattr(tenant_map.settings, "TENANT_MAP_PATH", str(path))
+    monkeypatch.setattr(tenant_map.settings, "TENANT_MAP_FORMAT", request.param)
+    monkeypatch.setattr(tenant_map.settings, "TENANT_MAP_RELOAD_COMMAND", "")
+    return path
+
+def read_map(path):
+    return _parse(path.read_bytes())
+
+def leftover_temp_files(path):
+    return [name for name in os.listdir(path.parent) if name.startswith(".tenants-")]
+
+def test_render_and_parse_round_trip(map_path):
+    hosts = {tenant_host("alice"): "alice", "alice.example.com": "alice", tenant_host("bob"): "bob"}
+    assert _parse(_render(hosts)) == hosts
+
+def test_render_formats(map_path):
+    rendered = _render({tenant_host("alice"): "alice"})
+    if tenant_map.settings.TENANT_MAP_FORMAT == "json":
+        assert orjson.loads(rendered) == {"hosts": {tenant_host("alice"): "alice"}}
+    else:
+        assert f"    {tenant_host('alice')} alice;\n" in rendered.decode()
+        assert 'default "";' in rendered.decode()
+
+def test_update_adds_and_removes_subdomains(map_path):
+    update_tenant_map(add=["alice", "bob"])
+    assert read_map(map_path) == {tenant_host("alice"): "alice", tenant_host("bob"): "bob"}
+    update_tenant_map(remove=["alice"])
+    assert read_map(map_path) == {tenant_host("bob"): "bob"}
+    assert leftover_temp_files(map_path) == []
+
+def test_update_adds_and_removes_custom_hosts(map_path):
+    update_tenant_map(add=["alice"], add_hosts={"alice.example.com": "alice"})
+    assert read_map(map_path)["alice.example.com"] == "alice"
+    update_tenant_map(remove_hosts=["alice.example.com"])
+    assert read_map(map_path) == {tenant_host("alice"): "alice"}
+
+def test_update_without_a_path_is_a_no_op(tmp_path, monkeypatch):
+    monkeypatch.setattr(tenant_map.settings, "TENANT_MAP_PATH", "")
+    monkeypatch.chdir(tmp_path)
+    update_tenant_map(add=["alice"])
+    assert os.listdir(tmp_path) == []
+
+def test_failed_write_leaves_the_map_and_no_temp_file(map_path, monkeypatch):
+    update_tenant_map(add=["alice"])
+    before = map_path.read_bytes()
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(tenant_map.os, "fsync", fail)
+    with pytest.raises(OSError):
+        update_tenant_map(add=["bob"])
+    assert map_path.read_bytes() == before
+    assert leftover_temp_files(map_path) == []
+
+def test_rebuild_maps_live_tenants_and_verified_domains(map_path, db_sessionmaker, monkeypatch):
+    db = db_sessionmaker()
+    now = datetime.now(timezone.utc)
+    alice = User(email="a@example.com", username="alice", provider="email")
+    gone = User(email="g@example.com", username="gone", provider="email", deleted_at=now)
+    db.add_all([alice, gone])
+    db.flush()
+    alice_site = Subdomain(user_id=alice.id, subdomain="alice")
+    gone_site = Subdomain(user_id=gone.id, subdomain="gone")
+    db.add_all([alice_site, gone_site])
+    db.flush()
+    db.add_all([
+        CustomDomain(subdomain_id=alice_site.id, domain="alice.example.com", verification_token="t1", verified_at=now),
+        CustomDomain(subdomain_id=alice_site.id, domain="pending.example.com", verification_token="t2"),
+        CustomDomain(subdomain_id=gone_site.id, domain="gone.example.com", verification_token="t3", verified_at=now),
+    ])
+    db.commit()
+    db.close()
+
+    # Stale entries are dropped rather than merged
+    update_tenant_map(add=["stale"])
+    monkeypatch.setattr(database, "SessionLocal", db_sessionmaker)
+    assert rebuild_tenant_map() == 2
+    assert read_map(map_path) == {tenant_host("alice"): "alice", "alice.example.com": "alice"}
+    assert leftover_temp_files(map_path) == []
@@ -0,0 +1,64 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.tracing import Span, TracingTransport, current_span, tracer, to_otlp
+
+@pytest.fixture
+def exported(monkeypatch):
+    spans = []
+    monkeypatch.setattr(tracer, "enabled", True)
+    monkeypatch.setattr(tracer, "export", spans.append)
+    monkeypatch.setattr("app.tracing.settings.TRACE_SAMPLE_RATE", 1.0)
+    return spans
+
+def fetch(handler):
+    async def run():
+        transport = TracingTransport(httpx.MockTransport(handler))
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.get("https://api.example.com/user?token=secret")
+    return asyncio.run(run())
+
+def test_outbound_call_is_traced(exported):
+    response = fetch(lambda request: httpx.Response(200, json={}))
+    assert response.status_code == 200
+    (span,) = exported
+    assert span.name == "HTTP GET"
+    # The query string can carry credentials, so it is left out
+    assert span.attributes["http.url"] == "https://api.example.com/user"
+    assert span.attributes["http.status_code"] == 200
+    assert span.end_ns is not None and span.error is None
+
+def test_failed_outbound_call_still_ends_its_span(exported):
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    with pytest.raises(httpx.ConnectError):
+        fetch(refuse)
+    (span,) = exported
+    assert span.end_ns is not None
+    assert span.error == "ConnectError: connection refused"
+    assert to_otlp([span])["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["status"]["code"] == 2
+
+def test_outbound_span_is_a_child_of_the_route_span(exported):
+    async def run():
+        with tracer.span("GET /auth/github/callback") as route:
+            transport = TracingTransport(httpx.MockTransport(lambda request: httpx.Response(204)))
+            async with httpx.AsyncClient(transport=transport) as client:
+                await client.get("https://api.example.com/")
+        return route
+
+    route = asyncio.run(run())
+    http, root = exported
+    assert http.parent_id == route.span_id and http.trace_id == route.trace_id
+    assert root is route
+
+def test_unsampled_traces_record_nothing(monkeypatch, exported):
+    monkeypatch.setattr("app.tracing.settings.TRACE_SAMPLE_RATE", 0.0)
+    with tracer.span("GET /") as span:
+        assert current_span.get() is span
+        with tracer.span("db.query"):
+            pass
+    assert exported == []
+    assert not isinstance(span, Span)
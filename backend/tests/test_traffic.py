@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from redis.exceptions import ConnectionError
+from sqlalchemy.dialects import postgresql
+from starlette.requests import Request
+
+from app import traffic
+from app.prefilter import _empty_filters, name_prefilter
+from app.traffic import TrafficCounter
+
+def make_request(ip):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"user-agent", b"test")],
+        "client": (ip, 1234),
+    })
+
+@pytest.fixture
+def tenants(monkeypatch):
+    monkeypatch.setattr(name_prefilter, "filters", _empty_filters())
+    monkeypatch.setattr(name_prefilter, "ready", True)
+    for name in ("alice", "bob"):
+        name_prefilter._add_local("subdomain", name)
+
+@pytest.fixture
+def counter(monkeypatch):
+    counter = TrafficCounter()
+    counter.written = []
+    monkeypatch.setattr(counter, "_subdomain_ids", lambda names: {"alice": 1, "bob": 2} if names else {})
+    monkeypatch.setattr(counter, "_write", lambda *args: counter.written.append(args))
+    return counter
+
+def today():
+    return datetime.now(timezone.utc).date()
+
+def test_record_skips_names_that_are_not_tenants(tenants):
+    counter = TrafficCounter()
+    counter.record("alice", make_request("203.0.113.1"))
+    counter.record("random-scan", make_request("203.0.113.1"))
+    assert dict(counter.requests) == {("alice", today()): 1}
+
+def test_record_caps_tracked_tenants(tenants, monkeypatch):
+    monkeypatch.setattr(traffic.settings, "TRAFFIC_MAX_TENANTS_PER_FLUSH", 1)
+    counter = TrafficCounter()
+    counter.record("alice", make_request("203.0.113.1"))
+    counter.record("bob", make_request("203.0.113.1"))
+    counter.record("alice", make_request("203.0.113.2"))
+    assert dict(counter.requests) == {("alice", today()): 2}
+    assert counter.dropped == 1
+
+def test_flush_counts_unique_visitors_across_flushes(fake_redis, tenants, counter):
+    async def run():
+        for ip in ("203.0.113.1", "203.0.113.2", "203.0.113.1"):
+            counter.record("alice", make_request(ip))
+        await counter.flush()
+        counter.record("alice", make_request("203.0.113.3"))
+        await counter.flush()
+
+    asyncio.run(run())
+    (first, first_uniques, ids), (second, second_uniques, _) = counter.written
+    key = ("alice", today())
+    assert first[key] == 3 and first_uniques[key] == 2
+    # Requests are deltas; uniques are the running HyperLogLog estimate
+    assert second[key] == 1 and second_uniques[key] == 3
+    assert ids == {"alice": 1, "bob": 2}
+    assert not counter.requests
+
+def test_flush_drops_prefilter_false_positives(fake_redis, tenants, counter, monkeypatch):
+    monkeypatch.setattr(counter, "_subdomain_ids", lambda names: {"alice": 1})
+
+    async def run():
+        counter.record("alice", make_request("203.0.113.1"))
+        counter.record("bob", make_request("203.0.113.1"))
+        await counter.flush()
+        return await fake_redis.keys("traffic:uv:bob:*")
+
+    assert asyncio.run(run()) == []
+    requests, uniques, _ = counter.written[0]
+    assert set(requests) == set(uniques) == {("alice", today())}
+
+def test_flush_writes_requests_without_uniques_when_redis_is_down(tenants, counter, monkeypatch):
+    class DownRedis:
+        def pipeline(self, transaction=False):
+            raise ConnectionError("down")
+
+    monkeypatch.setattr(traffic, "redis_client", DownRedis())
+    counter.record("alice", make_request("203.0.113.1"))
+    asyncio.run(counter.flush())
+    requests, uniques, _ = counter.written[0]
+    assert requests[("alice", today())] == 1
+    assert uniques == {}
+
+def test_upsert_never_lowers_the_stored_unique_count(monkeypatch):
+    executed = []
+
+    class FakeSession:
+        def execute(self, stmt):
+            executed.append(stmt)
+
+        def commit(self):
+            pass
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(traffic, "SessionLocal", FakeSession)
+    TrafficCounter()._write({("alice", today()): 5}, {}, {"alice": 1})
+    sql = str(executed[0].compile(dialect=postgresql.dialect()))
+    assert "requests = (tenant_traffic.requests + excluded.requests)" in sql
+    assert "unique_visitors = greatest(tenant_traffic.unique_visitors, excluded.unique_visitors)" in sql
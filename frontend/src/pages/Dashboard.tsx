@@ -15,7 +15,7 @@ import {
   AlertCircle
 } from 'lucide-react';
 import { useAuth } from '../contexts/AuthContext';
-import { Subdomain, SubdomainAvailability, AdminToken, AdminTokenStatus } from '../types/subdomain';
+import { Subdomain, SubdomainAvailability, SubdomainTaken, AdminToken, AdminTokenStatus } from '../types/subdomain';
 import api from '../lib/api';
 
 export default function Dashboard() {
@@ -106,7 +106,15 @@ export default function Dashboard() {
       toast.success('Subdomain created successfully!');
       fetchAdminTokenStatus(); // Refresh token status
     } catch (error: any) {
-      toast.error(error.response?.data?.detail || 'Failed to create subdomain');
+      const detail = error.response?.data?.detail;
+      if (detail?.suggestions) {
+        // Taken since the last check; offer the alternatives
+        const taken = detail as SubdomainTaken;
+        setSubdomainAvailability({ available: false, reason: taken.message, suggestions: taken.suggestions });
+        toast.error(taken.message);
+        return;
+      }
+      toast.error(detail || 'Failed to create subdomain');
     } finally {
       setIsCreatingSubdomain(false);
     }
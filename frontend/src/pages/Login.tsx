@@ -38,13 +38,9 @@ export default function Login() {
     }
   };
 
-  const handleOAuthLogin = async (provider: 'github' | 'discord') => {
-    try {
-      const response = await api.get(`/auth/${provider}`);
-      window.location.href = response.data.auth_url;
-    } catch (error) {
-      toast.error(`Failed to initialize ${provider} login`);
-    }
+  const handleOAuthLogin = (provider: 'github' | 'discord') => {
+    // Navigate (not XHR) so the API can set its state-binding cookie
+    window.location.href = `${api.defaults.baseURL}/auth/${provider}`;
   };
 
   return (
@@ -9,6 +9,23 @@ export interface Subdomain {
 export interface SubdomainAvailability {
   available: boolean;
   reason?: string;
+  suggestions?: string[];
+}
+
+// `detail` of a 400 from create or rename when the name is taken
+export interface SubdomainTaken {
+  message: string;
+  suggestions: string[];
+}
+
+export interface CustomDomain {
+  id: number;
+  domain: string;
+  subdomain: string;
+  verified: boolean;
+  // DNS record to publish before verifying; null once verified
+  verification: { type: string; name: string; value: string } | null;
+  created_at: string;
 }
 
 export interface AdminToken {